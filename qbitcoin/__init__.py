@@ -9,6 +9,7 @@ __version__ = "0.1.0"
 
 from .blockchain import Blockchain, Block, Transaction
 from .crypto import QBitcoinCrypto
+from .storage import BlockchainStore
 from .wallet import Wallet, WalletManager
 from .node import Node
 from .miner import Miner 
\ No newline at end of file
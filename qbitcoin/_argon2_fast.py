@@ -0,0 +1,185 @@
+"""
+Argon2 hashing with reusable contexts, for proof of work.
+
+argon2-cffi's hash_secret_raw sets up a new context for every hash, and
+libargon2 then allocates the full memory cost, which the kernel has to
+zero, and frees it again. For PoW, where the same parameters hash nonce
+after nonce, each mining thread instead keeps one context whose output,
+salt and Argon2 memory are reused: libargon2 is handed the same memory
+through its allocation callbacks. Threads that only verify proofs of work
+share a single context.
+
+The memory stays allocated for the life of the thread that hashed with it,
+or of the process for the shared context. It is mapped on huge pages where
+the system allows, since Argon2's random accesses over a large block of
+memory otherwise miss the TLB constantly.
+"""
+
+import mmap
+import threading
+from typing import Callable
+from argon2.exceptions import HashingError
+from argon2.low_level import ffi, lib, hash_secret_raw, error_to_str, Type
+
+
+def _callbacks_available() -> bool:
+    """Check that cffi can create callbacks, which some hardened systems forbid."""
+    try:
+        ffi.callback("int(uint8_t **, size_t)", lambda memory, size: 0)
+    except (MemoryError, RuntimeError):
+        return False
+    return True
+
+
+CALLBACKS_AVAILABLE = _callbacks_available()
+
+
+def _map_memory(size: int) -> mmap.mmap:
+    """
+    Map anonymous memory for Argon2, backed by huge pages where possible.
+    
+    Explicit huge pages are used if the system has reserved some; otherwise
+    the mapping is marked for transparent huge pages, which the kernel may
+    or may not grant. Either way the memory works with ordinary pages.
+    
+    Args:
+        size: Number of bytes to map
+    
+    Returns:
+        The mapping
+    """
+    flags = mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS
+    hugetlb = getattr(mmap, 'MAP_HUGETLB', 0)
+    if hugetlb:
+        try:
+            return mmap.mmap(-1, size, flags=flags | hugetlb)
+        except OSError:
+            pass  # No huge pages reserved
+    
+    memory = mmap.mmap(-1, size, flags=flags)
+    if hasattr(mmap, 'MADV_HUGEPAGE'):
+        try:
+            memory.madvise(mmap.MADV_HUGEPAGE)
+        except OSError:
+            pass
+    return memory
+
+
+class Argon2Context:
+    """An Argon2 context with fixed parameters, reused for every hash."""
+    
+    def __init__(self, salt: bytes, time_cost: int, memory_cost: int, parallelism: int,
+                 hash_len: int, type: Type):
+        """
+        Allocate the context and its buffers.
+        
+        Args:
+            salt: Salt used for every hash
+            time_cost: Number of iterations
+            memory_cost: Memory usage in KiB
+            parallelism: Number of lanes
+            hash_len: Output hash length
+            type: Argon2 variant
+        """
+        self._type = type.value
+        self._hash_len = hash_len
+        self._out = ffi.new("uint8_t[]", hash_len)
+        self._salt = ffi.new("uint8_t[]", salt)
+        self._mapping = _map_memory(memory_cost * 1024)
+        self._memory = ffi.from_buffer("uint8_t[]", self._mapping)
+        
+        # libargon2 asks for the same amount of memory on every call
+        @ffi.callback("int(uint8_t **, size_t)")
+        def allocate(memory, size):
+            if size > len(self._memory):
+                return lib.ARGON2_MEMORY_ALLOCATION_ERROR
+            memory[0] = self._memory
+            return lib.ARGON2_OK
+        
+        @ffi.callback("void(uint8_t *, size_t)")
+        def free(memory, size):
+            pass
+        
+        self._callbacks = (allocate, free)  # Must outlive the context
+        self._ctx = ffi.new("argon2_context *", {
+            'out': self._out,
+            'outlen': hash_len,
+            'salt': self._salt,
+            'saltlen': len(salt),
+            'secret': ffi.NULL,
+            'secretlen': 0,
+            'ad': ffi.NULL,
+            'adlen': 0,
+            't_cost': time_cost,
+            'm_cost': memory_cost,
+            'lanes': parallelism,
+            'threads': parallelism,
+            'version': lib.ARGON2_VERSION_13,
+            'allocate_cbk': allocate,
+            'free_cbk': free,
+            'flags': lib.ARGON2_DEFAULT_FLAGS
+        })
+    
+    def hash(self, password: bytes) -> bytes:
+        """
+        Hash a password with the context's parameters.
+        
+        Args:
+            password: Bytes to hash
+        
+        Returns:
+            The raw hash
+        """
+        password_buffer = ffi.from_buffer(password)
+        self._ctx.pwd = ffi.cast("uint8_t *", password_buffer)
+        self._ctx.pwdlen = len(password)
+        
+        result = lib.argon2_ctx(self._ctx, self._type)
+        if result != lib.ARGON2_OK:
+            raise HashingError(error_to_str(result))
+        return ffi.buffer(self._out, self._hash_len)[:]
+
+
+def make_hasher(salt: bytes, time_cost: int, memory_cost: int, parallelism: int,
+                hash_len: int, type: Type, per_thread: bool = True) -> Callable[[bytes], bytes]:
+    """
+    Get a raw Argon2 hash function with fixed parameters.
+    
+    Where cffi callbacks are unavailable, it hashes with hash_secret_raw
+    instead of a reusable context.
+    
+    Args:
+        per_thread: Give each thread calling it its own context, kept until
+            the thread exits, for threads that hash continuously; otherwise
+            callers take turns with one shared context
+    
+    Returns:
+        Function mapping a password to its raw hash
+    """
+    params = dict(salt=salt, time_cost=time_cost, memory_cost=memory_cost,
+                  parallelism=parallelism, hash_len=hash_len, type=type)
+    if not CALLBACKS_AVAILABLE:
+        return lambda password: hash_secret_raw(password, **params)
+    
+    if not per_thread:
+        lock = threading.Lock()
+        shared = None
+        
+        def hash_shared(password: bytes) -> bytes:
+            nonlocal shared
+            with lock:
+                if shared is None:
+                    shared = Argon2Context(**params)
+                return shared.hash(password)
+        
+        return hash_shared
+    
+    local = threading.local()
+    
+    def hash_raw(password: bytes) -> bytes:
+        context = getattr(local, 'context', None)
+        if context is None:
+            context = local.context = Argon2Context(**params)
+        return context.hash(password)
+    
+    return hash_raw
@@ -4,23 +4,76 @@ Implements a quantum-resistant blockchain using Argon2, SPHINCS+, and SHA-3.
 """
 
 import time
-import json
-from typing import List, Dict, Any, Optional
-from .crypto import QBitcoinCrypto
+import heapq
+import threading
+import struct
+import operator
+import itertools
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+import msgpack
+import orjson
+from .crypto import QBitcoinCrypto, PowWorkerPool, POW_NONCE
 
 # Blockchain configuration
-DIFFICULTY = 3  # Initial mining difficulty (number of leading zeros)
+DIFFICULTY = 12  # Initial mining difficulty (number of leading zero bits)
 BLOCK_REWARD = 50  # Initial block reward in QBitcoins
 HALVING_INTERVAL = 210000  # Number of blocks between reward halvings
 MAX_SUPPLY = 21000000  # Maximum supply of QBitcoins
 DIFFICULTY_ADJUSTMENT_INTERVAL = 2016  # Blocks between difficulty adjustments
 TARGET_BLOCK_TIME = 600  # Target time between blocks in seconds (10 minutes)
+MAX_BLOCK_TRANSACTIONS = 999  # Pending transactions included per block, besides the coinbase
+
+# Binary block header layout: index, previous hash, timestamp, transactions root.
+# The 8-byte little-endian nonce (crypto.POW_NONCE) is appended after this prefix.
+HEADER_PREFIX_FORMAT = '<Q32sd32s'
+HEADER_PREFIX = struct.Struct(HEADER_PREFIX_FORMAT)
+
+
+def _pack_bytes(data: bytes) -> bytes:
+    """Length-prefix a byte string for the binary encodings."""
+    return struct.pack('<I', len(data)) + data
+
+
+def _hashed_field(name: str, *caches: str) -> property:
+    """
+    Create a property for a hashed field that drops dependent caches on assignment.
+    
+    Args:
+        name: Field name; the value is stored under the underscored name
+        caches: Cache attributes reset to None when the field is assigned
+    
+    Returns:
+        The property
+    """
+    attr = '_' + name
+    
+    def setter(self, value):
+        setattr(self, attr, value)
+        for cache in caches:
+            setattr(self, cache, None)
+    
+    # attrgetter keeps reads in C, which matters in the per-transaction loops
+    return property(operator.attrgetter(attr), setter)
+
 
 class Transaction:
     """Represents a QBitcoin transaction."""
     
+    __slots__ = ('_sender', '_recipient', '_amount', '_fee', '_timestamp', '_signature',
+                 '_txid', '_canon', '_packed')
+    
+    # Fields covered by the txid; assigning one drops the cached txid and signing
+    # digest, and any field drops the cached msgpack encoding
+    sender = _hashed_field('sender', '_txid', '_canon', '_packed')
+    recipient = _hashed_field('recipient', '_txid', '_canon', '_packed')
+    amount = _hashed_field('amount', '_txid', '_canon', '_packed')
+    fee = _hashed_field('fee', '_txid', '_canon', '_packed')
+    timestamp = _hashed_field('timestamp', '_txid', '_canon', '_packed')
+    signature = _hashed_field('signature', '_packed')
+    
     def __init__(self, sender: str, recipient: str, amount: float, 
-                 fee: float, signature: Optional[str] = None):
+                 fee: float, signature: Optional[str] = None, timestamp: float = None,
+                 txid: Optional[bytes] = None):
         """
         Initialize a new transaction.
         
@@ -30,62 +83,86 @@ class Transaction:
             amount: Amount of QBitcoin to transfer
             fee: Transaction fee
             signature: Optional SPHINCS+ signature
+            timestamp: Creation time, defaults to now
+            txid: Known transaction ID, e.g. when loading; computed on demand otherwise
         """
         self.sender = sender
         self.recipient = recipient
         self.amount = amount
         self.fee = fee
-        self.timestamp = time.time()
+        self.timestamp = time.time() if timestamp is None else timestamp
         self.signature = signature
-        self.txid = self._calculate_txid()
+        if txid is not None:
+            self.txid = txid
     
-    def _calculate_txid(self) -> str:
+    @property
+    def txid(self) -> bytes:
+        """Transaction ID, computed on first use and cached until a field changes."""
+        if self._txid is None:
+            self._txid = self._calculate_txid()
+        return self._txid
+    
+    @txid.setter
+    def txid(self, txid: bytes) -> None:
+        self._txid = txid
+        self._canon = None
+        self._packed = None
+    
+    def _payload(self) -> bytes:
+        """Get the binary encoding of the fields covered by the txid."""
+        return b''.join((
+            _pack_bytes(self.sender.encode()),
+            _pack_bytes(self.recipient.encode()),
+            struct.pack('<ddd', self.amount, self.fee, self.timestamp)
+        ))
+    
+    def _calculate_txid(self) -> bytes:
         """Calculate the transaction ID using SHA-3."""
-        tx_data = {
-            'sender': self.sender,
-            'recipient': self.recipient,
-            'amount': self.amount,
-            'fee': self.fee,
-            'timestamp': self.timestamp
-        }
-        tx_str = json.dumps(tx_data, sort_keys=True)
-        return QBitcoinCrypto.sha3_256(tx_str)
+        return QBitcoinCrypto.sha3_256(self._payload())
+    
+    def has_valid_txid(self) -> bool:
+        """
+        Check the transaction ID against the transaction's fields.
+        
+        Loaded and received transactions carry their claimed txid, and the
+        block's Merkle root only covers txids, so this is what ties a block
+        to the contents of its transactions.
+        """
+        return self.txid == self._calculate_txid()
+    
+    def serialize(self) -> bytes:
+        """Serialize the transaction to its canonical binary form."""
+        signature = bytes.fromhex(self.signature) if self.signature else b''
+        return self.txid + self._payload() + _pack_bytes(signature)
+    
+    def _canonical_bytes(self) -> bytes:
+        """
+        Get the SHA-3 digest that is signed for this transaction.
+        
+        The digest covers the txid and the binary payload and is cached until
+        one of the transaction fields is reassigned.
+        """
+        if self._canon is None:
+            self._canon = QBitcoinCrypto.sha3_256(self.txid + self._payload())
+        return self._canon
     
     def sign(self, secret_key: str) -> None:
         """Sign the transaction using SPHINCS+."""
         # Only sign if not already signed
         if not self.signature:
-            tx_data = json.dumps({
-                'txid': self.txid,
-                'sender': self.sender,
-                'recipient': self.recipient,
-                'amount': self.amount,
-                'fee': self.fee,
-                'timestamp': self.timestamp
-            }, sort_keys=True)
-            
-            self.signature = QBitcoinCrypto.sign_message(tx_data, secret_key)
+            self.signature = QBitcoinCrypto.sign_message(self._canonical_bytes(), secret_key)
     
     def verify(self) -> bool:
         """Verify the transaction signature."""
-        if not self.signature:
+        if not self.signature or not self.has_valid_txid():
             return False
             
-        tx_data = json.dumps({
-            'txid': self.txid,
-            'sender': self.sender,
-            'recipient': self.recipient,
-            'amount': self.amount,
-            'fee': self.fee,
-            'timestamp': self.timestamp
-        }, sort_keys=True)
-        
-        return QBitcoinCrypto.verify_signature(tx_data, self.signature, self.sender)
+        return QBitcoinCrypto.verify_signature(self._canonical_bytes(), self.signature, self.sender)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert transaction to dictionary."""
         return {
-            'txid': self.txid,
+            'txid': self.txid.hex(),
             'sender': self.sender,
             'recipient': self.recipient,
             'amount': self.amount,
@@ -97,23 +174,73 @@ class Transaction:
     @classmethod
     def from_dict(cls, tx_dict: Dict[str, Any]) -> 'Transaction':
         """Create a transaction from dictionary."""
-        tx = cls(
+        return cls(
             sender=tx_dict['sender'],
             recipient=tx_dict['recipient'],
             amount=tx_dict['amount'],
             fee=tx_dict['fee'],
-            signature=tx_dict.get('signature')
+            signature=tx_dict.get('signature'),
+            timestamp=tx_dict['timestamp'],
+            txid=bytes.fromhex(tx_dict['txid'])
         )
-        tx.timestamp = tx_dict['timestamp']
-        tx.txid = tx_dict['txid']
-        return tx
+    
+    def to_record(self) -> Dict[str, Any]:
+        """Convert transaction to a dictionary with binary fields as raw bytes."""
+        return {
+            'txid': self.txid,
+            'sender': self.sender,
+            'recipient': self.recipient,
+            'amount': self.amount,
+            'fee': self.fee,
+            'timestamp': self.timestamp,
+            'signature': bytes.fromhex(self.signature) if self.signature else None
+        }
+    
+    @classmethod
+    def from_record(cls, tx_record: Dict[str, Any]) -> 'Transaction':
+        """Create a transaction from a dictionary produced by to_record."""
+        signature = tx_record['signature']
+        return cls(
+            sender=tx_record['sender'],
+            recipient=tx_record['recipient'],
+            amount=tx_record['amount'],
+            fee=tx_record['fee'],
+            signature=signature.hex() if signature else None,
+            timestamp=tx_record['timestamp'],
+            txid=tx_record['txid']
+        )
+    
+    def to_packed_record(self) -> bytes:
+        """
+        Get the transaction's to_record() form encoded with msgpack.
+        
+        The encoding is cached until a field is reassigned, like a block's.
+        """
+        if self._packed is None:
+            self._packed = msgpack.packb(self.to_record(), use_bin_type=True)
+        return self._packed
 
 
 class Block:
     """Represents a block in the QBitcoin blockchain."""
     
-    def __init__(self, index: int, previous_hash: str, timestamp: float = None,
-                 transactions: List[Transaction] = None, nonce: int = 0):
+    __slots__ = ('_index', '_previous_hash', '_timestamp', '_transactions', '_nonce', '_hash',
+                 '_tx_root', '_header_prefix', '_header_hash', '_json', '_packed')
+    
+    # Header fields; assigning one drops the cached header and header hash, and
+    # assigning any field drops the cached encodings of the whole block.
+    # The transactions list must not be mutated in place once the block is built.
+    index = _hashed_field('index', '_header_prefix', '_header_hash', '_json', '_packed')
+    previous_hash = _hashed_field('previous_hash', '_header_prefix', '_header_hash', '_json', '_packed')
+    timestamp = _hashed_field('timestamp', '_header_prefix', '_header_hash', '_json', '_packed')
+    transactions = _hashed_field('transactions', '_tx_root', '_header_prefix', '_header_hash',
+                                 '_json', '_packed')
+    nonce = _hashed_field('nonce', '_header_hash', '_json', '_packed')
+    hash = _hashed_field('hash', '_json', '_packed')
+    
+    def __init__(self, index: int, previous_hash: bytes, timestamp: float = None,
+                 transactions: List[Transaction] = None, nonce: int = 0,
+                 block_hash: Optional[bytes] = None):
         """
         Initialize a new block.
         
@@ -123,48 +250,112 @@ class Block:
             timestamp: Block creation time
             transactions: List of transactions in the block
             nonce: Nonce used for mining
+            block_hash: Known block hash, e.g. when loading; computed otherwise
         """
         self.index = index
         self.previous_hash = previous_hash
-        self.timestamp = timestamp or time.time()
+        self.timestamp = time.time() if timestamp is None else timestamp
         self.transactions = transactions or []
         self.nonce = nonce
-        self.hash = self._calculate_hash()
+        # The stored hash; blocks received or loaded carry their claimed hash here,
+        # which is_chain_valid checks against the header hash, computed once on demand.
+        self.hash = block_hash if block_hash is not None else self._calculate_hash()
     
-    def _calculate_hash(self) -> str:
-        """Calculate block hash using SHA-3."""
-        block_header = self._get_header_string()
-        return QBitcoinCrypto.sha3_256(block_header)
+    def _compute_tx_root(self) -> bytes:
+        """Compute the Merkle root over the transaction ids."""
+        level = [tx.txid for tx in self.transactions]
+        if not level:
+            return bytes(32)
     
-    def _get_header_string(self) -> str:
-        """Get the block header as a string for hashing."""
-        tx_data = json.dumps([tx.to_dict() for tx in self.transactions], sort_keys=True)
-        header_data = {
-            'index': self.index,
-            'previous_hash': self.previous_hash,
-            'timestamp': self.timestamp,
-            'transactions_root': QBitcoinCrypto.sha3_256(tx_data),
-            'nonce': self.nonce
-        }
-        return json.dumps(header_data, sort_keys=True)
+        while len(level) > 1:
+            # Odd levels pair the last node with itself
+            if len(level) % 2:
+                level.append(level[-1])
+            level = QBitcoinCrypto.sha3_256_many(
+                level[i] + level[i + 1] for i in range(0, len(level), 2)
+            )
+            
+        return level[0]
+    
+    def _get_tx_root(self) -> bytes:
+        """Get the cached Merkle root of the block's transactions."""
+        if self._tx_root is None:
+            self._tx_root = self._compute_tx_root()
+        return self._tx_root
+    
+    def _calculate_hash(self) -> bytes:
+        """
+        Calculate block hash using SHA-3.
+        
+        The hash is cached until a header field is reassigned, so checking a
+        loaded block against it does not rehash the header.
+        """
+        if self._header_hash is None:
+            self._header_hash = QBitcoinCrypto.sha3_256(self._get_header())
+        return self._header_hash
+    
+    def _get_header_prefix(self) -> bytes:
+        """
+        Get the nonce-independent part of the binary block header.
+        
+        The prefix is computed once, so re-hashing the header for a new nonce
+        only packs the trailing 8 bytes.
+        """
+        if self._header_prefix is None:
+            self._header_prefix = HEADER_PREFIX.pack(
+                self.index,
+                self.previous_hash,
+                self.timestamp,
+                self._get_tx_root()
+            )
+        return self._header_prefix
+    
+    def _get_header(self) -> bytes:
+        """Get the full binary block header, including the nonce."""
+        return self._get_header_prefix() + POW_NONCE.pack(self.nonce)
     
     def mine_block(self, difficulty: int) -> bool:
         """
         Mine the block using Argon2 proof of work.
         
         Args:
-            difficulty: Mining difficulty (number of leading zeros)
+            difficulty: Mining difficulty (number of leading zero bits)
             
         Returns:
             True if mining successful
         """
         print(f"Mining block {self.index} with difficulty {difficulty}...")
         
-        block_header = self._get_header_string()
-        nonce, hash_value = QBitcoinCrypto.argon2_pow(block_header, difficulty)
+        header_prefix = self._get_header_prefix()
+        nonce, _ = QBitcoinCrypto.argon2_pow(header_prefix, difficulty)
         
         self.nonce = nonce
-        self.hash = hash_value
+        self.hash = self._calculate_hash()
+        
+        return True
+    
+    def mine_block_parallel(self, difficulty: int, num_workers: int) -> bool:
+        """
+        Mine the block with the nonce search split across worker processes.
+        
+        Args:
+            difficulty: Mining difficulty (number of leading zero bits)
+            num_workers: Number of worker processes
+        
+        Returns:
+            True if mining successful
+        """
+        print(f"Mining block {self.index} with difficulty {difficulty} on {num_workers} workers...")
+        
+        header_prefix = self._get_header_prefix()
+        pow_pool = PowWorkerPool(num_workers)
+        try:
+            nonce, _ = pow_pool.search(header_prefix, difficulty)
+        finally:
+            pow_pool.close()
+        
+        self.nonce = nonce
+        self.hash = self._calculate_hash()
         
         return True
     
@@ -172,27 +363,66 @@ class Block:
         """Convert block to dictionary."""
         return {
             'index': self.index,
-            'previous_hash': self.previous_hash,
+            'previous_hash': self.previous_hash.hex(),
             'timestamp': self.timestamp,
             'transactions': [tx.to_dict() for tx in self.transactions],
             'nonce': self.nonce,
-            'hash': self.hash
+            'hash': self.hash.hex()
         }
     
+    def to_json(self) -> bytes:
+        """
+        Get the block's to_dict() form encoded as JSON.
+        
+        The encoding is cached until a field is reassigned, so a block sent
+        to several peers or requested repeatedly is only encoded once.
+        """
+        if self._json is None:
+            self._json = orjson.dumps(self.to_dict())
+        return self._json
+    
     @classmethod
     def from_dict(cls, block_dict: Dict[str, Any]) -> 'Block':
         """Create a block from dictionary."""
         transactions = [Transaction.from_dict(tx) for tx in block_dict['transactions']]
         
-        block = cls(
+        return cls(
             index=block_dict['index'],
-            previous_hash=block_dict['previous_hash'],
+            previous_hash=bytes.fromhex(block_dict['previous_hash']),
             timestamp=block_dict['timestamp'],
             transactions=transactions,
-            nonce=block_dict['nonce']
+            nonce=block_dict['nonce'],
+            block_hash=bytes.fromhex(block_dict['hash'])
+        )
+    
+    def to_record(self) -> Dict[str, Any]:
+        """Convert block to a dictionary with binary fields as raw bytes, for binary codecs."""
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [tx.to_record() for tx in self.transactions],
+            'nonce': self.nonce,
+            'hash': self.hash
+        }
+    
+    def to_packed_record(self) -> bytes:
+        """Get the block's to_record() form encoded with msgpack, cached like to_json()."""
+        if self._packed is None:
+            self._packed = msgpack.packb(self.to_record(), use_bin_type=True)
+        return self._packed
+    
+    @classmethod
+    def from_record(cls, block_record: Dict[str, Any]) -> 'Block':
+        """Create a block from a dictionary produced by to_record."""
+        return cls(
+            index=block_record['index'],
+            previous_hash=block_record['previous_hash'],
+            timestamp=block_record['timestamp'],
+            transactions=[Transaction.from_record(tx) for tx in block_record['transactions']],
+            nonce=block_record['nonce'],
+            block_hash=block_record['hash']
         )
-        block.hash = block_dict['hash']
-        return block
 
 
 class Blockchain:
@@ -201,8 +431,13 @@ class Blockchain:
     def __init__(self):
         """Initialize a new blockchain with genesis block."""
         self.chain: List[Block] = []
-        self.pending_transactions: List[Transaction] = []
+        # Max-heap of pending transactions by fee, as (-fee, arrival, tx) entries;
+        # the arrival counter keeps equal fees in first-come order.
+        self._pending: List[Tuple[float, int, Transaction]] = []
+        self._pending_counter = itertools.count()
         self.difficulty = DIFFICULTY
+        self._balances: Dict[str, float] = {}
+        self._chain_lock = threading.RLock()  # Serializes appends from different threads
         self.create_genesis_block()
     
     def create_genesis_block(self) -> None:
@@ -218,17 +453,89 @@ class Blockchain:
         # Create genesis block
         genesis_block = Block(
             index=0,
-            previous_hash="0" * 64,
+            previous_hash=bytes(32),
             transactions=[coinbase_tx]
         )
         
         # Add genesis block to chain
         self.chain.append(genesis_block)
+        self._index_block(genesis_block)
     
     def get_latest_block(self) -> Block:
         """Get the latest block in the chain."""
         return self.chain[-1]
     
+    def add_block(self, block: Block, verify_signatures: bool = True, verify_pow: bool = True) -> bool:
+        """
+        Append a block to the chain and update the balance index.
+        
+        Args:
+            block: Block to append
+            verify_signatures: Check the signatures of the block's transactions,
+                in parallel; skipped for blocks built from verified pending ones
+            verify_pow: Check the block's hash against its header and its proof
+                of work against the current difficulty; skipped for blocks
+                mined locally
+        
+        Returns:
+            True if the block extends the current chain tip, its txids,
+            proof of work and signatures are valid and it was added
+        """
+        # Held from the tip checks to the append, so blocks from the chain
+        # writer, a sync and the local miner cannot race onto the chain
+        with self._chain_lock:
+            if block.index != len(self.chain):
+                return False
+            
+            if block.previous_hash != self.get_latest_block().hash:
+                return False
+            
+            if not all(tx.has_valid_txid() for tx in block.transactions):
+                return False
+            
+            if verify_pow and not self._has_valid_pow(block):
+                return False
+            
+            txs = block.transactions[1:]  # Skip coinbase
+            if verify_signatures and txs and not all(QBitcoinCrypto.verify_signatures(
+                    [(tx._canonical_bytes(), tx.signature, tx.sender) for tx in txs])):
+                return False
+            
+            self.chain.append(block)
+            self._index_block(block)
+            
+            # Adjust difficulty if needed
+            if block.index % DIFFICULTY_ADJUSTMENT_INTERVAL == 0:
+                self._adjust_difficulty()
+            
+            return True
+    
+    def _has_valid_pow(self, block: Block) -> bool:
+        """Check that a block's hash is its header hash and its nonce meets the current difficulty."""
+        if block.hash != block._calculate_hash():
+            return False
+        return QBitcoinCrypto.verify_argon2_pow(block._get_header_prefix(), block.nonce, self.difficulty)
+    
+    @property
+    def pending_transactions(self) -> List[Transaction]:
+        """Pending transactions, in no particular order."""
+        return [tx for _, _, tx in self._pending]
+    
+    @pending_transactions.setter
+    def pending_transactions(self, transactions: List[Transaction]) -> None:
+        self._pending = []
+        for tx in transactions:
+            self._push_pending(tx)
+    
+    def _push_pending(self, transaction: Transaction) -> None:
+        """Add a transaction to the pending fee heap."""
+        heapq.heappush(self._pending, (-transaction.fee, next(self._pending_counter), transaction))
+    
+    def _pop_pending(self, count: int) -> List[Transaction]:
+        """Remove and return up to count pending transactions, highest fee first."""
+        pending = self._pending
+        return [heapq.heappop(pending)[2] for _ in range(min(count, len(pending)))]
+    
     def create_coinbase_transaction(self, miner_address: str) -> Transaction:
         """
         Create a coinbase transaction for block reward.
@@ -266,31 +573,32 @@ class Blockchain:
         """
         # Verify transaction signature
         if not transaction.verify():
-            print(f"Invalid signature for transaction {transaction.txid}")
+            print(f"Invalid signature for transaction {transaction.txid.hex()}")
             return False
         
         # Add to pending transactions
-        self.pending_transactions.append(transaction)
+        self._push_pending(transaction)
         return True
     
-    def mine_pending_transactions(self, miner_address: str) -> Block:
+    def build_candidate_block(self, miner_address: str) -> Tuple[Block, bytes, int]:
         """
-        Mine a new block with pending transactions.
+        Build the next block from the pending transactions, ready for a nonce search.
+        
+        The block's transactions leave the pending pool; finalize_block returns
+        them if the block does not make it onto the chain.
         
         Args:
             miner_address: Address to receive mining reward
             
         Returns:
-            The mined block
+            (block, header_prefix, difficulty) where header_prefix is the binary
+            header the nonce is appended to
         """
-        # Sort pending transactions by fee (highest first)
-        self.pending_transactions.sort(key=lambda tx: tx.fee, reverse=True)
-        
         # Create a new block with coinbase transaction
         coinbase_tx = self.create_coinbase_transaction(miner_address)
         
-        # Add transactions to block (coinbase first)
-        block_transactions = [coinbase_tx] + self.pending_transactions[:999]  # Limit transactions per block
+        # Take the highest-fee pending transactions (coinbase first)
+        block_transactions = [coinbase_tx] + self._pop_pending(MAX_BLOCK_TRANSACTIONS)
         
         # Create the new block
         latest_block = self.get_latest_block()
@@ -300,32 +608,74 @@ class Blockchain:
             transactions=block_transactions
         )
         
+        return new_block, new_block._get_header_prefix(), self.difficulty
+    
+    def finalize_block(self, block: Block, nonce: Optional[int]) -> bool:
+        """
+        Seal a candidate block with its nonce and add it to the chain.
+        
+        Args:
+            block: Block from build_candidate_block
+            nonce: Nonce meeting the target, or None if mining was abandoned
+        
+        Returns:
+            True if the block was added; otherwise its transactions are
+            returned to the pending pool
+        """
+        if nonce is not None:
+            block.nonce = nonce
+            block.hash = block._calculate_hash()
+            
+            # Pending transactions were verified when they were added
+            if self.add_block(block, verify_signatures=False, verify_pow=False):
+                return True
+        
+        # The tip moved while mining, or mining stopped
+        for tx in block.transactions[1:]:
+            self._push_pending(tx)
+        return False
+    
+    def mine_pending_transactions(self, miner_address: str, num_workers: int = 1) -> Block:
+        """
+        Mine a new block with pending transactions.
+        
+        Args:
+            miner_address: Address to receive mining reward
+            num_workers: Number of processes to search nonces with
+        
+        Returns:
+            The mined block
+        """
+        new_block, _, difficulty = self.build_candidate_block(miner_address)
+        
         # Mine the block
         start_time = time.time()
-        new_block.mine_block(self.difficulty)
+        if num_workers > 1:
+            new_block.mine_block_parallel(difficulty, num_workers)
+        else:
+            new_block.mine_block(difficulty)
         end_time = time.time()
         
         print(f"Block {new_block.index} mined in {end_time - start_time:.2f} seconds")
         
-        # Add block to chain
-        self.chain.append(new_block)
-        
-        # Remove mined transactions from pending
-        self.pending_transactions = self.pending_transactions[len(block_transactions)-1:]
-        
-        # Adjust difficulty if needed
-        if new_block.index % DIFFICULTY_ADJUSTMENT_INTERVAL == 0:
-            self._adjust_difficulty()
+        self.finalize_block(new_block, new_block.nonce)
         
         return new_block
     
     def is_chain_valid(self) -> bool:
-        """Validate the entire blockchain."""
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i-1]
+        """
+        Validate the entire blockchain.
             
-            # Check block hash
+        Headers and links are checked in one serial pass; the signatures of
+        all blocks are then verified in parallel, a block per task.
+        """
+        signed_blocks = []
+        
+        # Walk the chain once; a memory-mapped chain decodes each block on access
+        blocks = iter(self.chain)
+        previous_block = next(blocks)
+        for current_block in blocks:
+            # Check block hash (the header hash is cached once computed)
             if current_block.hash != current_block._calculate_hash():
                 print(f"Invalid hash for block {current_block.index}")
                 return False
@@ -335,22 +685,50 @@ class Blockchain:
                 print(f"Invalid previous hash for block {current_block.index}")
                 return False
             
-            # Check transactions
-            for tx in current_block.transactions[1:]:  # Skip coinbase
-                if not tx.verify():
-                    print(f"Invalid transaction {tx.txid} in block {current_block.index}")
+            # Check that the txids the Merkle root covers match the transactions
+            for tx in current_block.transactions:
+                if not tx.has_valid_txid():
+                    print(f"Invalid txid for transaction {tx.txid.hex()} in block {current_block.index}")
                     return False
+            
+            # Collect transactions for batch verification
+            txs = current_block.transactions[1:]  # Skip coinbase
+            for tx in txs:
+                if not tx.signature:
+                    print(f"Invalid transaction {tx.txid.hex()} in block {current_block.index}")
+                    return False
+            if txs:
+                signed_blocks.append((current_block.index, txs))
+            
+            previous_block = current_block
+        
+        # Check transaction signatures, one parallel task per block
+        positions = QBitcoinCrypto.verify_signature_batches([
+            [(tx._canonical_bytes(), tx.signature, tx.sender) for tx in txs]
+            for _, txs in signed_blocks
+        ])
+        for (block_index, txs), position in zip(signed_blocks, positions):
+            if position >= 0:
+                print(f"Invalid transaction {txs[position].txid.hex()} in block {block_index}")
+                return False
         
         return True
     
-    def _adjust_difficulty(self) -> None:
-        """Adjust mining difficulty to maintain target block time."""
-        if len(self.chain) <= DIFFICULTY_ADJUSTMENT_INTERVAL:
+    def _adjust_difficulty(self, height: Optional[int] = None) -> None:
+        """
+        Adjust mining difficulty to maintain target block time.
+        
+        Args:
+            height: Chain height to adjust at, defaults to the full chain
+        """
+        if height is None:
+            height = len(self.chain)
+        if height <= DIFFICULTY_ADJUSTMENT_INTERVAL:
             return
         
         # Get the first and last block in the adjustment period
-        latest_block = self.get_latest_block()
-        adjustment_block = self.chain[len(self.chain) - DIFFICULTY_ADJUSTMENT_INTERVAL]
+        latest_block = self.chain[height - 1]
+        adjustment_block = self.chain[height - DIFFICULTY_ADJUSTMENT_INTERVAL]
         
         # Calculate time taken to mine the blocks
         time_taken = latest_block.timestamp - adjustment_block.timestamp
@@ -364,18 +742,31 @@ class Blockchain:
         
         print(f"Difficulty adjusted to {self.difficulty}")
     
+    def _index_block(self, block: Block) -> None:
+        """Apply a block's transactions to the balance index."""
+        self._apply_transactions(block.transactions)
+    
+    def _apply_transactions(self, transactions: Iterable[Transaction]) -> None:
+        """Apply transactions to the balance index."""
+        balances = self._balances
+        get = balances.get
+        for tx in transactions:
+            amount = tx.amount
+            recipient = tx.recipient
+            sender = tx.sender
+            balances[recipient] = get(recipient, 0) + amount
+            balances[sender] = get(sender, 0) - (amount + tx.fee)
+    
+    def _rebuild_balances(self) -> None:
+        """Rebuild the balance index from the whole chain in a single pass."""
+        self._balances = {}
+        self._apply_transactions(itertools.chain.from_iterable(
+            block.transactions for block in self.chain
+        ))
+    
     def get_balance(self, address: str) -> float:
         """Get the balance of a given address."""
-        balance = 0
-        
-        for block in self.chain:
-            for tx in block.transactions:
-                if tx.recipient == address:
-                    balance += tx.amount
-                if tx.sender == address:
-                    balance -= (tx.amount + tx.fee)
-        
-        return balance
+        return self._balances.get(address, 0)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert blockchain to dictionary."""
@@ -385,11 +776,69 @@ class Blockchain:
             'difficulty': self.difficulty
         }
     
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Capture the state derived from replaying the chain.
+        
+        Returns:
+            Dictionary with the chain height, tip hash, balance index and
+            difficulty, as accepted by from_blocks
+        """
+        return {
+            'height': len(self.chain),
+            'tip': self.get_latest_block().hash,
+            'balances': dict(self._balances),
+            'difficulty': self.difficulty
+        }
+    
+    @classmethod
+    def from_blocks(cls, blocks: Sequence[Block],
+                    snapshot: Optional[Dict[str, Any]] = None) -> 'Blockchain':
+        """
+        Create a blockchain by replaying blocks on top of their genesis block.
+        
+        The sequence becomes the chain and is walked once, so a lazily decoded
+        sequence is never materialized. Replay stops at the first block that
+        does not extend the chain.
+        
+        Args:
+            blocks: Blocks from genesis onwards
+            snapshot: Optional state from snapshot() taken at a height within
+                blocks; only the blocks after it are replayed
+        """
+        blockchain = cls()
+        blockchain.chain = blocks
+        blockchain._balances = {}
+        
+        start = 0
+        previous_block = None
+        if snapshot:
+            start = snapshot['height']
+            previous_block = blocks[start - 1]
+            blockchain._balances = dict(snapshot['balances'])
+            blockchain.difficulty = snapshot['difficulty']
+        
+        for height in range(start, len(blocks)):
+            block = blocks[height]
+            if previous_block is not None and (block.index != height
+                                               or block.previous_hash != previous_block.hash):
+                print(f"Stopped replaying blocks at {block.index} - does not extend the chain")
+                blockchain.chain = blocks[:height]
+                break
+            
+            blockchain._index_block(block)
+            if height and height % DIFFICULTY_ADJUSTMENT_INTERVAL == 0:
+                blockchain._adjust_difficulty(height + 1)
+            previous_block = block
+        
+        return blockchain
+    
     @classmethod
     def from_dict(cls, blockchain_dict: Dict[str, Any]) -> 'Blockchain':
         """Create a blockchain from dictionary."""
         blockchain = cls()
         blockchain.chain = [Block.from_dict(block_dict) for block_dict in blockchain_dict['chain']]
+        blockchain._rebuild_balances()
         blockchain.pending_transactions = [Transaction.from_dict(tx_dict) 
                                          for tx_dict in blockchain_dict['pending_transactions']]
         blockchain.difficulty = blockchain_dict['difficulty']
@@ -7,17 +7,19 @@ Allows users to manage wallets, send transactions, and control mining.
 import os
 import sys
 import argparse
-import json
 import time
 import socket
 from typing import Optional, List, Dict, Any
+import orjson
 
 from .blockchain import Blockchain, Transaction
+from .storage import BlockchainStore
 from .wallet import Wallet, WalletManager
-from .node import Node
+from .node import Node, configure_socket
 from .miner import Miner
 
 DATA_DIR = os.path.expanduser("~/.qbitcoin")
+NODE_READY_TIMEOUT = 10  # Seconds to wait for a started node before mining
 
 
 def setup_directories() -> None:
@@ -31,37 +33,31 @@ class QBitcoinCLI:
     
     def __init__(self):
         """Initialize the CLI."""
+        self.store = BlockchainStore(DATA_DIR)
         self.blockchain = self._load_or_create_blockchain()
         self.wallet_manager = WalletManager(os.path.join(DATA_DIR, "wallets"))
         self.node: Optional[Node] = None
         self.miner: Optional[Miner] = None
+        self._external_sock: Optional[socket.socket] = None  # Connection to an external node
     
     def _load_or_create_blockchain(self) -> Blockchain:
         """Load blockchain from disk or create a new one."""
-        blockchain_path = os.path.join(DATA_DIR, "blockchain.json")
-        
-        if os.path.exists(blockchain_path):
-            try:
-                with open(blockchain_path, 'r') as f:
-                    blockchain_dict = json.load(f)
-                print(f"Loaded blockchain from {blockchain_path}")
-                return Blockchain.from_dict(blockchain_dict)
-            except Exception as e:
-                print(f"Error loading blockchain: {e}")
+        try:
+            blockchain = self.store.load()
+            if blockchain:
+                print(f"Loaded blockchain from {self.store.blocks_path}")
+                return blockchain
+        except Exception as e:
+            print(f"Error loading blockchain: {e}")
         
         # Create new blockchain
         print("Creating new blockchain")
         return Blockchain()
     
-    def _save_blockchain(self) -> None:
-        """Save blockchain to disk."""
-        blockchain_path = os.path.join(DATA_DIR, "blockchain.json")
-        blockchain_dict = self.blockchain.to_dict()
-        
-        with open(blockchain_path, 'w') as f:
-            json.dump(blockchain_dict, f)
-        
-        print(f"Saved blockchain to {blockchain_path}")
+    def _save_blockchain(self, snapshot: bool = False) -> None:
+        """Save blockchain to disk, with a state snapshot if requested."""
+        self.store.save(self.blockchain, snapshot)
+        print(f"Saved blockchain to {self.store.blocks_path}")
     
     def create_wallet(self, name: str) -> None:
         """Create a new wallet."""
@@ -80,8 +76,9 @@ class QBitcoinCLI:
         for name in wallets:
             wallet = self.wallet_manager.get_wallet(name)
             if wallet:
-                balance = self.blockchain.get_balance(wallet.get_public_key())
-                print(f"  {name}: {balance} QBT (Address: {wallet.get_public_key()[:16]}...)")
+                address = wallet.get_public_key()
+                balance = self.blockchain.get_balance(address)  # O(1) balance index lookup
+                print(f"  {name}: {balance} QBT (Address: {address[:16]}...)")
     
     def get_balance(self, wallet_name: str) -> None:
         """Get the balance of a wallet."""
@@ -107,7 +104,7 @@ class QBitcoinCLI:
             
             # Add to blockchain
             if self.blockchain.add_transaction(tx):
-                print(f"Transaction {tx.txid} added to pending transactions")
+                print(f"Transaction {tx.txid.hex()} added to pending transactions")
                 
                 # If node running, broadcast transaction
                 if self.node:
@@ -137,17 +134,16 @@ class QBitcoinCLI:
                 'port': int(seed_port)
             })
         
-        # Create and start node
+        # Create and start node, sharing the blockchain and the store it is saved through
         self.node = Node(
             host=host,
             port=port,
             data_dir=DATA_DIR,
-            seed_peers=seed_peers
+            seed_peers=seed_peers,
+            blockchain=self.blockchain,
+            store=self.store
         )
         
-        # Share the blockchain with the node
-        self.node.blockchain = self.blockchain
-        
         # Start the node
         try:
             self.node.start()
@@ -168,12 +164,15 @@ class QBitcoinCLI:
         
         # Update blockchain
         self.blockchain = self.node.blockchain
-        self._save_blockchain()
+        self._save_blockchain(snapshot=True)
     
     def _detect_external_node(self, host="127.0.0.1", port=9333):
         """
         Check if there's an external QBitcoin node already running.
         
+        The connection used to ping the node is kept open, so the miner can
+        broadcast blocks over it and a later check pings over it again.
+        
         Args:
             host: Host to check (default: localhost)
             port: Port to check (default: 9333)
@@ -181,44 +180,65 @@ class QBitcoinCLI:
         Returns:
             bool: True if an external node is detected, False otherwise
         """
+        # Ping over the open connection first, then over a new one
+        if self._external_sock is not None:
+            if self._ping_external_node(self._external_sock):
+                return True
+            self._close_external_sock()
+        
         try:
-            # Try to establish a connection to check if port is in use
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(1)
-            result = s.connect_ex((host, port))
-            s.close()
+            client = socket.create_connection((host, port), timeout=1)
+        except OSError:
+            # Nothing listening
+            return False
+        configure_socket(client)
+        self._external_sock = client
             
-            # If port is open, a node is likely running
-            if result == 0:
-                # Attempt to send a ping to confirm it's a QBitcoin node
-                client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                client.settimeout(2)
-                client.connect((host, port))
+        if self._ping_external_node(client):
+            return True
+        self._close_external_sock()
+        return False
                 
-                # Send a ping message
-                message = {
-                    'type': 'ping'
-                }
+    def _ping_external_node(self, client: socket.socket) -> bool:
+        """
+        Ping a node over an open connection.
                 
-                client.sendall(json.dumps(message).encode('utf-8'))
+        Returns:
+            bool: True if it answered like a QBitcoin node
+        """
+        try:
+            client.settimeout(2)
                 
-                # Try to get a response
-                try:
-                    response = client.recv(1024)
-                    if response:
-                        # Parse response to confirm it's a QBitcoin node
-                        response_data = json.loads(response.decode('utf-8'))
-                        if response_data.get('type') == 'pong':
-                            return True
-                except:
-                    pass
-                finally:
-                    client.close()
+            # Send a ping message
+            message = {
+                'type': 'ping'
+            }
             
+            client.sendall(orjson.dumps(message))
+            
+            # Parse response to confirm it's a QBitcoin node
+            response = client.recv(1024)
+            client.settimeout(5)
+            try:
+                response_data = orjson.loads(response)
+            except ValueError:
+                return False
+            return isinstance(response_data, dict) and response_data.get('type') == 'pong'
+        except OSError:
+            # Connection closed, or the node did not answer in time
             return False
         except Exception as e:
             print(f"Error detecting external node: {e}")
             return False
+    
+    def _close_external_sock(self) -> None:
+        """Close the connection to the external node, if open."""
+        if self._external_sock is not None:
+            try:
+                self._external_sock.close()
+            except OSError:
+                pass
+            self._external_sock = None
 
     def start_mining(self, wallet_name: str) -> None:
         """Start mining with the specified wallet."""
@@ -245,22 +265,26 @@ class QBitcoinCLI:
                 # Start a node with default parameters
                 try:
                     self.start_node()
-                    # Give the node a moment to initialize and connect to peers
-                    print("Waiting for node to initialize and connect to peers...")
-                    time.sleep(3)
+                    # Wait until the node is listening and has synced with its peers
+                    if self.node and self.node.running:
+                        print("Waiting for node to initialize and connect to peers...")
+                        if not self.node.ready.wait(timeout=NODE_READY_TIMEOUT):
+                            print(f"Warning: Node not ready after {NODE_READY_TIMEOUT} seconds, mining anyway")
                 except Exception as e:
                     print(f"Warning: Failed to start node - {e}")
                     print("Mining will continue in offline mode (blocks won't propagate to network).")
         
         # Create and start miner
-        self.miner = Miner(self.blockchain, wallet, data_dir=DATA_DIR)
+        self.miner = Miner(self.blockchain, wallet, data_dir=DATA_DIR, store=self.store)
         
         # Link miner to node for block propagation if node is running
         if (self.node and self.node.running) or external_node:
             if external_node:
                 print("Mining with external node block propagation enabled.")
                 # If using external node, we'll broadcast differently
-                self.miner.set_external_node("127.0.0.1", 9333)
+                # Hand over the connection the node was detected on
+                self.miner.set_external_node("127.0.0.1", 9333, self._external_sock)
+                self._external_sock = None
             else:
                 print("Mining with network block propagation enabled.")
                 # Hook up miner to broadcast new blocks via node
@@ -281,7 +305,7 @@ class QBitcoinCLI:
         print("Mining stopped")
         
         # Save blockchain
-        self._save_blockchain()
+        self._save_blockchain(snapshot=True)
     
     def show_blockchain(self) -> None:
         """Show blockchain information."""
@@ -289,7 +313,7 @@ class QBitcoinCLI:
         print(f"Mining difficulty: {self.blockchain.difficulty}")
         
         latest_block = self.blockchain.get_latest_block()
-        print(f"Latest block: {latest_block.index} (hash: {latest_block.hash[:16]}...)")
+        print(f"Latest block: {latest_block.index} (hash: {latest_block.hash.hex()[:16]}...)")
         print(f"Pending transactions: {len(self.blockchain.pending_transactions)}")
     
     def is_valid(self) -> None:
@@ -4,24 +4,376 @@ Implements SPHINCS+ signatures, Argon2 for PoW, and SHA-3 hashing.
 """
 
 import os
+import sys
+import struct
 import hashlib
 import binascii
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from Crypto.Hash import SHA3_256
+import functools
+import threading
+import multiprocessing
+from typing import Dict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from argon2.low_level import Type
 import pyspx.shake256_128f as sphincs  # Real SPHINCS+ implementation
+from ._argon2_fast import make_hasher
 
 # Parameters for Argon2 (tuned for mining)
-# These parameters can be adjusted to change mining difficulty
+# A block takes about 2**difficulty attempts, and each attempt makes
+# ARGON2_TIME_COST passes over ARGON2_MEMORY_COST KiB, so the expected work
+# per block scales with 2**difficulty * time_cost * memory_cost: doubling
+# either cost is worth about one bit of difficulty. Each attempt is a single
+# lane; mining gets its parallelism from one worker process per core instead.
 ARGON2_TIME_COST = 2        # Number of iterations
 ARGON2_MEMORY_COST = 102400  # Memory usage in KiB (100 MB)
-ARGON2_PARALLELISM = 8      # Number of threads
+ARGON2_PARALLELISM = 1      # Lanes per hash
 ARGON2_HASH_LEN = 32        # Output hash length
 
+# Proof-of-work hashes must be reproducible, so the Argon2 salt is fixed.
+# Its version changes whenever the parameters above or the PoW digest do;
+# v3 compares the raw Argon2 output against the target.
+POW_SALT = b'QBitcoin-PoW-v3\x00'
+POW_BATCH_SIZE = 16         # Nonces tried per argon2_pow_batch call
+POW_NONCE = struct.Struct('<Q')  # Nonce appended to the header prefix
+POW_WORKER_NICENESS = 5     # Added to mining processes' nice value, keeping network threads responsive
+
+# On free-threaded CPython (3.13t and later) threads hash in parallel, so PoW
+# workers can share memory instead of running as separate processes
+GIL_DISABLED = getattr(sys, '_is_gil_disabled', lambda: False)()
+
+# Argon2 with every PoW parameter bound up front; only the password varies per
+# nonce, so each mining thread reuses one Argon2 context and its memory
+_argon2_pow_raw = make_hasher(
+    salt=POW_SALT,
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+    hash_len=ARGON2_HASH_LEN,
+    type=Type.ID
+)
+# Verification hashes one nonce per block, from whichever node thread received
+# it, so those threads share one context rather than each keeping its memory
+_argon2_verify_raw = make_hasher(
+    salt=POW_SALT,
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+    hash_len=ARGON2_HASH_LEN,
+    type=Type.ID,
+    per_thread=False
+)
+
 # SPHINCS+ parameters
 SPHINCS_PUBLIC_KEY_SIZE = sphincs.crypto_sign_PUBLICKEYBYTES
 SPHINCS_SECRET_KEY_SIZE = sphincs.crypto_sign_SECRETKEYBYTES
 SPHINCS_SIGNATURE_SIZE = sphincs.crypto_sign_BYTES
+VERIFY_CACHE_SIZE = 1 << 20  # Valid signatures remembered, oldest evicted first
+
+# CPU quota files: cgroup v2 holds "quota period" in one file, v1 in two
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _cgroup_cpu_limit():
+    """
+    Read the CPU quota of the process's cgroup, in cores.
+    
+    Returns:
+        The quota rounded up to whole cores, or None if there is no quota
+    """
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open(CGROUP_V1_QUOTA) as f:
+                quota = f.read().strip()
+            with open(CGROUP_V1_PERIOD) as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    
+    try:
+        quota, period = int(quota), int(period)
+    except ValueError:
+        return None  # "max" means unlimited
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, -(-quota // period))
+
+
+def usable_cpu_count() -> int:
+    """
+    Get the number of CPUs this process can actually use.
+    
+    Unlike os.cpu_count(), this honors the process's CPU affinity and, in
+    containers, the cgroup CPU quota, both of which can be far below the
+    host's core count.
+    
+    Returns:
+        Number of usable CPUs, at least 1
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count() or 1
+    
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        count = min(count, limit)
+    return max(1, count)
+
+
+def _search_nonces(block_header, target_difficulty, worker_id, num_workers, stop_event):
+    """Search the nonces congruent to worker_id modulo num_workers until found or stopped."""
+    nonce = worker_id
+    
+    while not stop_event.is_set():
+        result = QBitcoinCrypto.argon2_pow_batch(
+            block_header, target_difficulty, nonce, POW_BATCH_SIZE,
+            stride=num_workers, stop_event=stop_event
+        )
+        if result:
+            return result
+        
+        nonce += POW_BATCH_SIZE * num_workers
+    
+    return None
+
+
+def _tune_pow_worker(worker_index):
+    """
+    Pin a mining process to one core and lower its priority.
+    
+    Cores are assigned round-robin over the ones the process may run on, so
+    each worker keeps its Argon2 memory in the same core's caches. Either
+    step is skipped where the platform does not support it.
+    """
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cores[worker_index % len(cores)]})
+        if hasattr(os, 'nice'):
+            os.nice(POW_WORKER_NICENESS)
+    except OSError:
+        pass
+
+
+# Stop event shared by the workers of a PowWorkerPool, set by its initializer
+_pool_stop_event = None
+
+
+def _init_pow_pool(stop_event, worker_counter):
+    """Keep the pool's stop event in the worker process and tune the process."""
+    global _pool_stop_event
+    _pool_stop_event = stop_event
+    
+    with worker_counter.get_lock():
+        worker_index = worker_counter.value
+        worker_counter.value += 1
+    _tune_pow_worker(worker_index)
+
+
+def _pow_pool_task(block_header, target_difficulty, worker_id, num_workers):
+    """Search one nonce residue class in a pool worker."""
+    return _search_nonces(block_header, target_difficulty, worker_id, num_workers, _pool_stop_event)
+
+
+def _pow_target(difficulty_bits):
+    """
+    Get the exclusive upper bound a PoW digest must stay under for a difficulty.
+    
+    The bound is big-endian bytes, so digests are compared with it directly
+    rather than converted to integers first.
+    """
+    if difficulty_bits <= 0:
+        return b'\xff' * (ARGON2_HASH_LEN + 1)  # Above every digest
+    return (1 << (ARGON2_HASH_LEN * 8 - difficulty_bits)).to_bytes(ARGON2_HASH_LEN, 'big')
+
+
+# Process pool for signature verification, started on first use and kept warm
+_verify_pool = None
+_verify_pool_lock = threading.Lock()
+
+
+def _get_verify_pool():
+    """Get the shared signature verification pool, starting it if needed."""
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is None:
+            _verify_pool = ProcessPoolExecutor(max_workers=usable_cpu_count())
+        return _verify_pool
+
+
+# Cache keys of signatures already verified as valid, oldest first. Validity
+# depends only on the message, signature and key, so entries never go stale.
+_verify_cache: Dict[bytes, bool] = {}
+_verify_cache_lock = threading.Lock()
+
+
+def _raw_signature_item(item):
+    """Decode the hex signature and public key of a tuple so workers receive bytes."""
+    message, signature, public_key = item
+    if isinstance(message, str):
+        message = message.encode()
+    try:
+        if not isinstance(signature, bytes):
+            signature = binascii.unhexlify(signature)
+        if not isinstance(public_key, bytes):
+            public_key = binascii.unhexlify(public_key)
+        return message, signature, public_key
+    except (ValueError, TypeError):
+        return item  # Left for the worker to reject
+
+
+def _verify_cache_key(item):
+    """Get the cache key of a raw signature tuple, or None if it cannot be valid."""
+    message, signature, public_key = item
+    # Fixed sizes keep the concatenation below unambiguous
+    if (not isinstance(signature, bytes) or len(signature) != SPHINCS_SIGNATURE_SIZE
+            or not isinstance(public_key, bytes) or len(public_key) != SPHINCS_PUBLIC_KEY_SIZE):
+        return None
+    return hashlib.blake2b(public_key + signature + message, digest_size=16).digest()
+
+
+def _remember_valid(key):
+    """Add a verified signature's cache key, evicting the oldest past VERIFY_CACHE_SIZE."""
+    if key is None:
+        return
+    with _verify_cache_lock:
+        _verify_cache[key] = True
+        if len(_verify_cache) > VERIFY_CACHE_SIZE:
+            del _verify_cache[next(iter(_verify_cache))]
+
+
+def _uncached_signatures(items):
+    """
+    Decode signature tuples, skipping those already known to be valid.
+    
+    Returns:
+        List of (position, raw tuple, cache key) for the signatures to verify
+    """
+    unchecked = []
+    for position, item in enumerate(items):
+        item = _raw_signature_item(item)
+        key = _verify_cache_key(item)
+        if key is None or key not in _verify_cache:
+            unchecked.append((position, item, key))
+    return unchecked
+
+
+def _verify_raw(message, signature, public_key):
+    """Verify a SPHINCS+ signature, given as hex or raw bytes, without the cache."""
+    if isinstance(message, str):
+        message = message.encode()
+    try:
+        signature_bytes = signature if isinstance(signature, bytes) else binascii.unhexlify(signature)
+        public_key_bytes = public_key if isinstance(public_key, bytes) else binascii.unhexlify(public_key)
+        return sphincs.verify(message, signature_bytes, public_key_bytes)
+    except Exception as e:
+        print(f"Verification error: {e}")
+        return False
+
+
+def _check_signatures(items):
+    """Verify raw signature tuples without the cache, in parallel when there are several."""
+    if len(items) < 2:
+        return [_verify_raw(*item) for item in items]
+    
+    num_workers = min(len(items), usable_cpu_count())
+    chunksize = max(1, len(items) // (num_workers * 4))
+    return list(_get_verify_pool().map(_verify_signature_task, items, chunksize=chunksize))
+
+
+def _verify_signature_task(item):
+    """Verify one (message, signature, public_key) tuple in a pool worker."""
+    return _verify_raw(*item)
+
+
+def _verify_batch_task(items):
+    """Verify a batch of signature tuples, returning the position of the first invalid one or -1."""
+    for position, item in enumerate(items):
+        if not _verify_raw(*item):
+            return position
+    return -1
+
+
+class PowWorkerPool:
+    """
+    Persistent worker pool for Argon2 nonce searches.
+    
+    The workers are started once and reused for every block; each search
+    splits the nonce space into num_workers residue classes, and the first
+    hit stops the others through a shared event. Workers are processes,
+    or threads when the interpreter runs without a GIL.
+    """
+    
+    def __init__(self, num_workers: int, use_threads: bool = GIL_DISABLED):
+        """
+        Start the pool.
+        
+        Args:
+            num_workers: Number of workers
+            use_threads: Search with threads rather than processes; defaults
+                to whether the GIL is disabled
+        """
+        self.num_workers = num_workers
+        self.use_threads = use_threads
+        if use_threads:
+            self._stop_event = threading.Event()
+            self._pool = ThreadPoolExecutor(max_workers=num_workers)
+            self._task = functools.partial(_search_nonces, stop_event=self._stop_event)
+        else:
+            self._stop_event = multiprocessing.Event()
+            self._pool = ProcessPoolExecutor(
+                max_workers=num_workers,
+                initializer=_init_pow_pool,
+                initargs=(self._stop_event, multiprocessing.Value('i', 0))
+            )
+            self._task = _pow_pool_task
+    
+    def search(self, block_header, target_difficulty, should_stop=None, poll_interval=0.5):
+        """
+        Search for a nonce meeting the target.
+        
+        Args:
+            block_header: Binary header prefix; the 8-byte nonce is appended
+            target_difficulty: Target number of leading zero bits
+            should_stop: Optional callable polled while searching; the search
+                is abandoned once it returns True
+            poll_interval: Seconds between should_stop polls
+        
+        Returns:
+            (nonce, hash) tuple, or None if the search was abandoned
+        """
+        self._stop_event.clear()
+        futures = [
+            self._pool.submit(self._task, block_header, target_difficulty, worker_id, self.num_workers)
+            for worker_id in range(self.num_workers)
+        ]
+        
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result:
+                        return result
+                
+                if should_stop is not None and should_stop():
+                    return None
+            
+            raise RuntimeError("All PoW workers exited without finding a nonce")
+        finally:
+            # Stop the other workers and let them drain before the next search
+            self._stop_event.set()
+            wait(futures)
+    
+    def close(self) -> None:
+        """Stop any search in progress and shut the workers down."""
+        self._stop_event.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
 
 
 class QBitcoinCrypto:
@@ -49,25 +401,151 @@ class QBitcoinCrypto:
     
     @staticmethod
     def verify_signature(message, signature, public_key):
-        """Verify a SPHINCS+ signature."""
-        if isinstance(message, str):
-            message = message.encode()
-        try:
-            signature_bytes = binascii.unhexlify(signature)
-            public_key_bytes = binascii.unhexlify(public_key)
-            return sphincs.verify(message, signature_bytes, public_key_bytes)
-        except Exception as e:
-            print(f"Verification error: {e}")
-            return False
+        """Verify a SPHINCS+ signature, given as hex or raw bytes."""
+        return QBitcoinCrypto.verify_signatures([(message, signature, public_key)])[0]
+    
+    @staticmethod
+    def verify_signatures(items):
+        """
+        Verify many SPHINCS+ signatures in parallel.
+        
+        Each verification is independent, pure computation, so the batch is
+        spread over a warm process pool to get past the GIL. Signatures are
+        sent to the workers as bytes, half the size of their hex form.
+        Signatures verified as valid before are not checked again.
+        
+        Args:
+            items: List of (message, signature, public_key) tuples
+        
+        Returns:
+            List of verification results in input order
+        """
+        results = [True] * len(items)
+        unchecked = _uncached_signatures(items)
+        checked = _check_signatures([item for _, item, _ in unchecked])
+        for (position, _, key), valid in zip(unchecked, checked):
+            results[position] = valid
+            if valid:
+                _remember_valid(key)
+        return results
+    
+    @staticmethod
+    def verify_signature_batches(batches):
+        """
+        Verify batches of SPHINCS+ signatures, one pool task per batch.
+        
+        Batches (e.g. the transactions of one block) are handed to the pool
+        whole, in about one chunk per worker, so IPC is paid per chunk rather
+        than per signature. With fewer batches than workers the signatures are
+        spread individually instead. Signatures verified as valid before are
+        not checked again.
+        
+        Args:
+            batches: List of lists of (message, signature, public_key) tuples
+        
+        Returns:
+            For each batch, the position of its first invalid signature, or -1
+        """
+        unchecked = [_uncached_signatures(batch) for batch in batches]
+        todo = [i for i, batch in enumerate(unchecked) if batch]
+        positions = [-1] * len(batches)
+        
+        num_workers = usable_cpu_count()
+        if len(todo) < max(2, num_workers):
+            results = iter(_check_signatures([item for i in todo for _, item, _ in unchecked[i]]))
+            for i in todo:
+                for position, _, key in unchecked[i]:
+                    if next(results):
+                        _remember_valid(key)
+                    elif positions[i] < 0:
+                        positions[i] = position
+            return positions
+        
+        chunksize = max(1, len(todo) // num_workers)
+        failures = _get_verify_pool().map(
+            _verify_batch_task,
+            [[item for _, item, _ in unchecked[i]] for i in todo],
+            chunksize=chunksize
+        )
+        for i, failure in zip(todo, failures):
+            batch = unchecked[i]
+            for _, _, key in (batch if failure < 0 else batch[:failure]):
+                _remember_valid(key)
+            if failure >= 0:
+                positions[i] = batch[failure][0]
+        return positions
     
     @staticmethod
     def sha3_256(data):
-        """Compute SHA3-256 hash of data."""
-        if isinstance(data, str):
-            data = data.encode()
-        h = SHA3_256.new()
-        h.update(data)
-        return h.hexdigest()
+        """Compute SHA3-256 hash of data as raw bytes."""
+        return hashlib.sha3_256(data.encode() if isinstance(data, str) else data).digest()
+    
+    @staticmethod
+    def sha3_256_hex(data):
+        """Compute SHA3-256 hash of data as a hex string."""
+        return QBitcoinCrypto.sha3_256(data).hex()
+    
+    @staticmethod
+    def sha3_256_many(bufs):
+        """
+        Compute the SHA3-256 digests of many byte strings.
+        
+        hashlib's SHA-3 is OpenSSL's, which uses the CPU's SHA-3 instructions
+        where available; hashing a batch here keeps the per-call overhead to a
+        single local lookup.
+        
+        Args:
+            bufs: Iterable of byte strings
+        
+        Returns:
+            List of raw 32-byte digests in input order
+        """
+        sha3 = hashlib.sha3_256
+        return [sha3(buf).digest() for buf in bufs]
+    
+    @staticmethod
+    def _pow_hash(data):
+        """Hash PoW input on the calling thread's Argon2 context, for nonce searches."""
+        return _argon2_pow_raw(data)
+    
+    @staticmethod
+    def argon2_pow_batch(block_header, target_difficulty, start_nonce, count, stride=1,
+                         stop_event=None):
+        """
+        Try a range of nonces against the target.
+        
+        Args:
+            block_header: Binary header prefix; the 8-byte nonce is appended
+            target_difficulty: Target number of leading zero bits
+            start_nonce: First nonce to try
+            count: Number of nonces to try
+            stride: Step between consecutive nonces
+            stop_event: Optional event that aborts the batch when set
+        
+        Returns:
+            (nonce, hash) tuple if a nonce meets the target, otherwise None
+        """
+        pack_nonce_into = POW_NONCE.pack_into
+        pow_hash_of = QBitcoinCrypto._pow_hash
+        target = _pow_target(target_difficulty)
+        nonces = range(start_nonce, start_nonce + count * stride, stride)
+        
+        # The header is written into the buffer once; each attempt only
+        # overwrites the trailing nonce bytes. Argon2 needs bytes, so a single
+        # copy of the buffer is made per attempt.
+        nonce_offset = len(block_header)
+        buffer = bytearray(block_header) + bytes(POW_NONCE.size)
+        
+        for nonce in nonces:
+            if stop_event is not None and stop_event.is_set():
+                return None
+                
+            pack_nonce_into(buffer, nonce_offset, nonce)
+            pow_hash = pow_hash_of(bytes(buffer))
+            if pow_hash < target:
+                return nonce, pow_hash
+        
+        return None
     
     @staticmethod
     def argon2_pow(block_header, target_difficulty):
@@ -75,59 +553,25 @@ class QBitcoinCrypto:
         Proof of work using Argon2 memory-hard function.
         
         Args:
-            block_header: Header data to hash
-            target_difficulty: Target number of leading zeros
+            block_header: Binary header prefix; the 8-byte nonce is appended
+            target_difficulty: Target number of leading zero bits
             
         Returns:
             (nonce, hash) tuple if successful
         """
-        ph = PasswordHasher(
-            time_cost=ARGON2_TIME_COST,
-            memory_cost=ARGON2_MEMORY_COST,
-            parallelism=ARGON2_PARALLELISM,
-            hash_len=ARGON2_HASH_LEN
-        )
-        
         nonce = 0
-        target_prefix = '0' * target_difficulty
         
         while True:
-            data = f"{block_header}{nonce}"
-            hash_output = ph.hash(data)
+            result = QBitcoinCrypto.argon2_pow_batch(
+                block_header, target_difficulty, nonce, POW_BATCH_SIZE
+            )
+            if result:
+                return result
             
-            # Extract the actual hash part (after the parameters)
-            hash_value = hash_output.split('$')[-1]
-            
-            # Convert to hex for comparison with target
-            hex_hash = binascii.hexlify(
-                hashlib.sha3_256(hash_value.encode()).digest()
-            ).decode()
-            
-            if hex_hash.startswith(target_prefix):
-                return nonce, hex_hash
-            
-            nonce += 1
+            nonce += POW_BATCH_SIZE
     
     @staticmethod
     def verify_argon2_pow(block_header, nonce, target_difficulty):
         """Verify an Argon2 proof of work."""
-        ph = PasswordHasher(
-            time_cost=ARGON2_TIME_COST,
-            memory_cost=ARGON2_MEMORY_COST,
-            parallelism=ARGON2_PARALLELISM,
-            hash_len=ARGON2_HASH_LEN
-        )
-        
-        data = f"{block_header}{nonce}"
-        hash_output = ph.hash(data)
-        
-        # Extract the actual hash part
-        hash_value = hash_output.split('$')[-1]
-        
-        # Convert to hex for comparison with target
-        hex_hash = binascii.hexlify(
-            hashlib.sha3_256(hash_value.encode()).digest()
-        ).decode()
-        
-        target_prefix = '0' * target_difficulty
-        return hex_hash.startswith(target_prefix) 
\ No newline at end of file
+        pow_hash = _argon2_verify_raw(block_header + POW_NONCE.pack(nonce))
+        return pow_hash < _pow_target(target_difficulty)
\ No newline at end of file
@@ -4,18 +4,26 @@ QBitcoin miner implementation using Argon2 memory-hard proof of work.
 
 import time
 import threading
-import multiprocessing
 import os
-import json
+import queue
+import select
+import socket
 from typing import Optional
 from .blockchain import Blockchain, Block
+from .crypto import PowWorkerPool, usable_cpu_count
+from .node import configure_socket, encode_frame
+from .storage import BlockchainStore
 from .wallet import Wallet
-import socket  # Add this import if not already present
+
+RECONNECT_BACKOFF_MAX = 60.0  # Longest wait in seconds between external node reconnects
+ERROR_BACKOFF_MIN = 0.05  # First wait in seconds after a mining error, doubling per repeat
+ERROR_BACKOFF_MAX = 5.0  # Longest wait in seconds after repeated mining errors
 
 class Miner:
     """QBitcoin miner for creating new blocks."""
     
-    def __init__(self, blockchain: Blockchain, wallet: Wallet, data_dir: str = "data", num_threads: int = None):
+    def __init__(self, blockchain: Blockchain, wallet: Wallet, data_dir: str = "data", num_threads: int = None,
+                 store: Optional[BlockchainStore] = None):
         """
         Initialize a miner.
         
@@ -23,35 +31,67 @@ class Miner:
             blockchain: Blockchain to mine on
             wallet: Wallet to receive mining rewards
             data_dir: Directory to save blockchain data
-            num_threads: Number of mining threads (auto-detected if None)
+            num_threads: Number of mining worker processes (auto-detected if None)
+            store: Store the blockchain was loaded from, shared with anything
+                else saving it, such as a node; one is created in data_dir if None
         """
         self.blockchain = blockchain
         self.wallet = wallet
         self.data_dir = data_dir
+        if store is None and data_dir:
+            store = BlockchainStore(data_dir)
+        self.store = store
         
         # Determine optimal number of parallel mining threads if not specified
         if num_threads is None:
-            self.num_threads = max(1, multiprocessing.cpu_count() - 1)
+            self.num_threads = max(1, usable_cpu_count() - 1)
         else:
             self.num_threads = num_threads
         
-        # Mining thread
+        # Mining thread, and the worker processes it searches nonces with
         self.is_mining = False
         self.mining_thread = None
+        self.pow_pool: Optional[PowWorkerPool] = None
+        
+        # Background writer saving the chain after each block. A save request
+        # made while one is already pending is covered by it, since every save
+        # writes all blocks not yet stored; None stops the writer.
+        self.writer_thread = None
+        self._save_requests: queue.Queue = queue.Queue(maxsize=1)
+        
+        # Reward address, resolved when mining starts, and rewards mined since then
+        self.miner_address: Optional[str] = None
+        self._mined_reward_total = 0.0
+        
+        # Wait after a mining error, reset by the next mined block, and when
+        # an error was last printed
+        self._error_backoff = ERROR_BACKOFF_MIN
+        self._error_logged_at = 0.0
         
         # Node reference for broadcasting blocks (optional)
         self.node = None
         self.external_node_host = None
         self.external_node_port = None
+        self._external_sock: Optional[socket.socket] = None  # Kept open between broadcasts
+        self._reconnect_delay = 0.0  # Doubles after each failed connection attempt
+        self._reconnect_at = 0.0  # Monotonic time before which no reconnect is tried
+        
+        # How mined blocks are propagated, resolved when the node is set
+        self._publish_block = None  # Puts a block on the internal node's publish queue
+        self._external_enabled = False
     
     def set_node(self, node) -> None:
         """Set a reference to the node for broadcasting blocks."""
         self.node = node
         self.external_node_host = None
         self.external_node_port = None
+        self._close_external_connection()
+        new_block_queue = getattr(node, 'new_block_queue', None)
+        self._publish_block = new_block_queue.put if new_block_queue is not None else None
+        self._external_enabled = False
         print("Miner connected to node for block propagation.")
     
-    def set_external_node(self, host: str, port: int) -> None:
+    def set_external_node(self, host: str, port: int, sock: Optional[socket.socket] = None) -> None:
         """
         Set an external node for broadcasting blocks.
         Used when mining with a node started in a different process.
@@ -59,10 +99,16 @@ class Miner:
         Args:
             host: External node host
             port: External node port
+            sock: Open connection to the node to broadcast over, if there is one
         """
         self.node = None
         self.external_node_host = host
         self.external_node_port = port
+        self._close_external_connection()
+        self._external_sock = sock
+        self._reconnect_delay = self._reconnect_at = 0.0
+        self._publish_block = None
+        self._external_enabled = bool(host and port)
         print(f"Miner connected to external node at {host}:{port} for block propagation.")
     
     def start_mining(self) -> None:
@@ -72,11 +118,19 @@ class Miner:
             return
         
         self.is_mining = True
+        self.miner_address = self.wallet.get_public_key()
+        self._mined_reward_total = 0.0
+        self.pow_pool = PowWorkerPool(self.num_threads)
+        if self.store:
+            self.writer_thread = threading.Thread(target=self._writer_loop)
+            self.writer_thread.daemon = True
+            self.writer_thread.start()
         self.mining_thread = threading.Thread(target=self._mine_continuously)
         self.mining_thread.daemon = True
         self.mining_thread.start()
         
-        print(f"Started mining with {self.num_threads} threads...")
+        worker_kind = "threads" if self.pow_pool.use_threads else "processes"
+        print(f"Started mining with {self.num_threads} worker {worker_kind}...")
     
     def stop_mining(self) -> None:
         """Stop mining."""
@@ -84,91 +138,180 @@ class Miner:
         if self.mining_thread:
             self.mining_thread.join(timeout=1.0)
             self.mining_thread = None
+        if self.pow_pool:
+            self.pow_pool.close()
+            self.pow_pool = None
+        if self.writer_thread:
+            self._save_requests.put(None)
+            self.writer_thread.join()
+            self.writer_thread = None
+        self._close_external_connection()
         print("Mining stopped")
-        self._save_blockchain()
+        self._save_blockchain(snapshot=True)
     
-    def _save_blockchain(self) -> None:
+    def _save_blockchain(self, snapshot: bool = False) -> None:
         """Save blockchain to disk if data_dir is configured."""
-        if not self.data_dir:
+        if not self.store:
             return
             
-        os.makedirs(self.data_dir, exist_ok=True)
-        blockchain_path = os.path.join(self.data_dir, "blockchain.json")
-        blockchain_dict = self.blockchain.to_dict()
-        
         try:
-            with open(blockchain_path, 'w') as f:
-                json.dump(blockchain_dict, f)
-            print(f"Saved blockchain to {blockchain_path}")
+            self.store.save(self.blockchain, snapshot)
+            print(f"Saved blockchain to {self.store.blocks_path}")
         except Exception as e:
             print(f"Error saving blockchain: {e}")
     
+    def _request_save(self) -> None:
+        """Ask the writer thread to save the blockchain, without waiting for it."""
+        if not self.writer_thread:
+            return
+        try:
+            self._save_requests.put_nowait(True)
+        except queue.Full:
+            pass  # The pending save will include the new block
+    
+    def _writer_loop(self) -> None:
+        """Save the blockchain whenever requested, until told to stop."""
+        while self._save_requests.get() is not None:
+            self._save_blockchain()
+    
     def _mine_continuously(self) -> None:
         """Mine blocks continuously until stopped."""
+        miner_address = self.miner_address
+        
         while self.is_mining:
             try:
-                # Get miner's address from wallet
-                miner_address = self.wallet.get_public_key()
+                # Search the candidate block's nonce on the worker pool, giving up
+                # on it if mining stops or another block extends the chain first
+                new_block, header_prefix, difficulty = self.blockchain.build_candidate_block(miner_address)
+                
+                def is_stale() -> bool:
+                    return (not self.is_mining
+                            or self.blockchain.get_latest_block().hash != new_block.previous_hash)
+                
+                start_ns = time.perf_counter_ns()
+                result = self.pow_pool.search(header_prefix, difficulty, should_stop=is_stale)
+                mining_time = (time.perf_counter_ns() - start_ns) * 1e-9
                 
-                # Mine a block
-                start_time = time.time()
-                new_block = self.blockchain.mine_pending_transactions(miner_address)
-                end_time = time.time()
+                if not self.blockchain.finalize_block(new_block, result[0] if result else None):
+                    if self.is_mining:
+                        print(f"Discarded block {new_block.index} - chain tip moved while mining")
+                    continue
+                
+                self._error_backoff = ERROR_BACKOFF_MIN
                 
                 # Calculate hashrate (approximately)
-                hashrate = 2**self.blockchain.difficulty / (end_time - start_time)
+                hashrate = (1 << difficulty) / mining_time
+                self._mined_reward_total += new_block.transactions[0].amount
                 
-                print(f"Mined block {new_block.index} with {len(new_block.transactions)} transactions")
-                print(f"Block hash: {new_block.hash}")
-                print(f"Mining time: {end_time - start_time:.2f} seconds")
-                print(f"Approximate hashrate: {hashrate:.2f} H/s")
-                print(f"Current balance: {self.wallet.get_balance(self.blockchain)}")
+                # One print for the whole report, so other threads cannot interleave with it
+                print(f"Mined block {new_block.index} with {len(new_block.transactions)} transactions\n"
+                      f"Block hash: {new_block.hash.hex()}\n"
+                      f"Mining time: {mining_time:.2f} seconds\n"
+                      f"Approximate hashrate: {hashrate:.2f} H/s\n"
+                      f"Rewards mined this session: {self._mined_reward_total}")
                 
-                # Save blockchain after successful mining
-                self._save_blockchain()
+                # Save blockchain after successful mining, overlapping the
+                # write with the next block's nonce search
+                self._request_save()
                 
                 # Broadcast the new block to the network if connected to a node
-                if self.node and hasattr(self.node, '_broadcast_new_block'):
-                    try:
-                        self.node._broadcast_new_block(new_block)
-                        print(f"Block {new_block.index} broadcast to the network via internal node ✅")
-                    except Exception as e:
-                        print(f"Failed to broadcast block to network via internal node: {e}")
+                # Hand the block to the node's publisher thread rather than
+                # broadcasting it from the mining thread
+                if self._publish_block:
+                    self._publish_block(new_block)
+                    print(f"Block {new_block.index} queued for broadcast via internal node ✅")
                 # If we have external node details, broadcast to it
-                elif self.external_node_host and self.external_node_port:
-                    try:
-                        self._broadcast_to_external_node(new_block)
+                elif self._external_enabled:
+                    if self._broadcast_to_external_node(new_block):
                         print(f"Block {new_block.index} broadcast to the network via external node ✅")
-                    except Exception as e:
-                        print(f"Failed to broadcast block to network via external node: {e}")
                 
             except Exception as e:
-                print(f"Mining error: {e}")
-                time.sleep(5)  # Wait before retrying on error
+                # Print at most one error a second, and back off exponentially
+                # while errors repeat so transient ones only pause briefly
+                now = time.monotonic()
+                if now - self._error_logged_at >= 1.0:
+                    print(f"Mining error: {e}")
+                    self._error_logged_at = now
+                time.sleep(self._error_backoff)
+                self._error_backoff = min(self._error_backoff * 2, ERROR_BACKOFF_MAX)
                 
     def _broadcast_to_external_node(self, block):
         """
         Broadcast a newly mined block to an external node.
         
+        Blocks are sent as length-prefixed frames over a single long-lived
+        connection, which is re-established if the node has closed it.
+        
         Args:
             block: The Block object to broadcast
         """
+        message = {
+            'type': 'new_block'
+        }
+        data = encode_frame(message, packed={'block': block.to_packed_record()})
+        
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(5)
-            client.connect((self.external_node_host, self.external_node_port))
-            
-            message = {
-                'type': 'new_block',
-                'block': block.to_dict()
-            }
-            
-            client.sendall(json.dumps(message).encode('utf-8'))
-            client.close()
+            client = self._external_connection()
+            try:
+                client.sendall(data)
+            except OSError:
+                # Broken pipe or reset: reconnect and send once more
+                self._close_external_connection()
+                self._external_connection().sendall(data)
             return True
         except Exception as e:
+            self._close_external_connection()
             print(f"Error broadcasting to external node: {e}")
             return False
+    
+    def _external_connection(self) -> socket.socket:
+        """
+        Get the connection to the external node, opening it if needed.
+        
+        After a failed connection attempt, further attempts back off
+        exponentially up to RECONNECT_BACKOFF_MAX seconds.
+        
+        Returns:
+            The connected socket
+        
+        Raises:
+            OSError: If the node cannot be reached or is backed off
+        """
+        client = self._external_sock
+        if client is not None:
+            # A connection the node has closed reads as end of file
+            try:
+                readable, _, _ = select.select([client], [], [], 0)
+                if readable and not client.recv(1, socket.MSG_PEEK):
+                    client = None
+            except OSError:
+                client = None
+            if client is None:
+                self._close_external_connection()
+        
+        if client is None:
+            now = time.monotonic()
+            if now < self._reconnect_at:
+                raise ConnectionError(f"External node unreachable, retrying in {self._reconnect_at - now:.0f}s")
+            try:
+                client = socket.create_connection((self.external_node_host, self.external_node_port), timeout=5)
+            except OSError:
+                self._reconnect_delay = min(max(1.0, self._reconnect_delay * 2), RECONNECT_BACKOFF_MAX)
+                self._reconnect_at = now + self._reconnect_delay
+                raise
+            self._reconnect_delay = 0.0
+            configure_socket(client)
+            self._external_sock = client
+        return client
+    
+    def _close_external_connection(self) -> None:
+        """Close the connection to the external node, if open."""
+        if self._external_sock is not None:
+            try:
+                self._external_sock.close()
+            except OSError:
+                pass
+            self._external_sock = None
 
 
 def main():
@@ -193,22 +336,19 @@ def main():
     print(f"Mining rewards will go to: {wallet.get_public_key()}")
     
     # Load or create blockchain
-    blockchain_path = os.path.join(data_dir, "blockchain.json")
-    if os.path.exists(blockchain_path):
-        try:
-            with open(blockchain_path, 'r') as f:
-                blockchain_dict = json.load(f)
-            from .blockchain import Blockchain
-            blockchain = Blockchain.from_dict(blockchain_dict)
-            print(f"Loaded blockchain from {blockchain_path}")
-        except Exception as e:
-            print(f"Error loading blockchain: {e}")
-            blockchain = Blockchain()
-    else:
+    store = BlockchainStore(data_dir)
+    blockchain = None
+    try:
+        blockchain = store.load()
+        if blockchain:
+            print(f"Loaded blockchain from {store.blocks_path}")
+    except Exception as e:
+        print(f"Error loading blockchain: {e}")
+    if not blockchain:
         blockchain = Blockchain()
     
     # Create and start miner
-    miner = Miner(blockchain, wallet, data_dir)
+    miner = Miner(blockchain, wallet, data_dir, store=store)
     try:
         miner.start_mining()
         # Keep main thread alive
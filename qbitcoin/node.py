@@ -5,12 +5,21 @@ Handles peer discovery, blockchain synchronization, and transaction propagation.
 
 import socket
 import threading
-import json
+import re
+import struct
+import queue
 import time
 import random
 import os
-from typing import Dict, List, Any, Set, Optional
-from .blockchain import Blockchain, Block, Transaction
+import select
+import selectors
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Any, Iterable, Set, Optional, Tuple
+import msgpack
+import orjson
+from .blockchain import Blockchain, Block, Transaction, MAX_BLOCK_TRANSACTIONS
+from .crypto import SPHINCS_PUBLIC_KEY_SIZE, SPHINCS_SIGNATURE_SIZE
+from .storage import BlockchainStore, replace_file
 from .wallet import Wallet, WalletManager
 from datetime import datetime
 
@@ -19,12 +28,331 @@ DEFAULT_PORT = 9333
 MAX_PEERS = 8
 PING_INTERVAL = 30  # Seconds between peer pings
 SYNC_INTERVAL = 60  # Seconds between blockchain syncs
+# Largest transaction as bare JSON: the hex signature, the two hex addresses,
+# and headroom for the txid, amounts, timestamp and keys
+MAX_TRANSACTION_SIZE = 2 * SPHINCS_SIGNATURE_SIZE + 4 * SPHINCS_PUBLIC_KEY_SIZE + 512
+# Largest message accepted: a full block as bare JSON, its coinbase included,
+# plus room for the block header and message envelope
+MAX_MESSAGE_SIZE = (MAX_BLOCK_TRANSACTIONS + 1) * MAX_TRANSACTION_SIZE + 64 * 1024
+SOCKET_BUFFER_SIZE = 4 << 20  # Kernel send/receive buffer for long-lived connections
+FRAME_HEADER = struct.Struct('>I')  # Length prefix of a framed message
+SELECT_TIMEOUT = 1.0  # Seconds the server waits for socket events before checking for shutdown
+CLIENT_SEND_TIMEOUT = 5  # Seconds a reply may take to send to a client
+MAX_IDLE_CONNECTIONS = 2  # Open connections kept per peer for reuse
+DISCOVERY_FANOUT = 3  # Peers asked for their peers in each discovery round
+MAX_INCOMING_BLOCKS = 256  # Blocks from peers waiting for the chain writer; more are dropped
 
 # Default seed nodes - production servers that are always online
 DEFAULT_SEED_PEERS = [
     {"host": "195.201.33.112", "port": 9333}  # Main QBitcoin seed node
 ]
 
+
+def configure_socket(sock: socket.socket) -> None:
+    """
+    Tune a connected socket for exchanging small messages.
+    
+    Disables Nagle's algorithm so messages are sent immediately, enlarges
+    the kernel buffers so a block does not have to wait for them to drain,
+    and enables keepalive so a dead peer on an idle connection is noticed.
+    
+    Args:
+        sock: TCP socket to configure
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+
+def encode_frame(message: Dict[str, Any], packed: Optional[Dict[str, bytes]] = None) -> bytes:
+    """
+    Encode a message as a length-prefixed frame.
+    
+    Args:
+        message: Message to encode
+        packed: Further message fields whose values are already encoded with
+            msgpack, such as cached blocks, included as they are
+    
+    Returns:
+        4-byte big-endian payload length followed by the msgpack payload
+    """
+    if not packed:
+        payload = msgpack.packb(message, use_bin_type=True)
+    else:
+        packer = msgpack.Packer(use_bin_type=True)
+        parts = [packer.pack_map_header(len(message) + len(packed))]
+        for key, value in message.items():
+            parts += (packer.pack(key), packer.pack(value))
+        for key, value in packed.items():
+            parts += (packer.pack(key), value)
+        payload = b''.join(parts)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def encode_json(message: Dict[str, Any], encoded: Optional[Dict[str, bytes]] = None) -> bytes:
+    """
+    Encode a message as bare JSON.
+    
+    Args:
+        message: Message to encode
+        encoded: Further message fields whose values are already encoded as
+            JSON, such as cached blocks, included as they are
+    
+    Returns:
+        The JSON object
+    """
+    data = orjson.dumps(message)
+    if not encoded:
+        return data
+    
+    parts = [data[:-1]]
+    for key, value in encoded.items():
+        parts += (b',' if len(parts) > 1 or message else b'', orjson.dumps(key), b':', value)
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+_NON_WHITESPACE = re.compile(rb'\S')
+_JSON_TOKEN = re.compile(rb'[{}"]')  # Bytes that change the brace depth of bare JSON
+_JSON_STRING_TOKEN = re.compile(rb'["\\]')  # Bytes that end or escape within a JSON string
+
+
+def _recv_into_all(sock: socket.socket, view: memoryview) -> int:
+    """
+    Receive into a buffer until it is full or the connection closes.
+    
+    Returns:
+        Number of bytes received
+    """
+    received = 0
+    while received < len(view):
+        count = sock.recv_into(view[received:])
+        if not count:
+            break
+        received += count
+    return received
+
+
+class NoReplyError(ConnectionError):
+    """Connection closed without any reply, as on a request the peer does not handle."""
+
+
+def receive_reply(sock: socket.socket) -> Dict[str, Any]:
+    """
+    Receive the reply to a request.
+    
+    Replies are frames, or bare JSON from nodes that predate framing, which
+    end the reply by closing the connection. A frame's payload is received
+    straight into a buffer of its final size, once its length has been
+    checked against MAX_MESSAGE_SIZE.
+    
+    Args:
+        sock: Socket the request was sent on
+    
+    Returns:
+        The reply
+    
+    Raises:
+        NoReplyError: If the connection closes before any of the reply arrives
+        ConnectionError: If the connection closes before the reply is complete
+        ValueError: If the reply exceeds MAX_MESSAGE_SIZE
+    """
+    header = bytearray(FRAME_HEADER.size)
+    received = _recv_into_all(sock, memoryview(header))
+    if not received:
+        raise NoReplyError("Connection closed without a reply")
+    
+    if header[:1] == b'{':
+        buffer = header[:received]
+        while True:
+            chunk = sock.recv(1024 * 1024)
+            if not chunk:
+                return orjson.loads(buffer)
+            buffer += chunk
+            if len(buffer) > MAX_MESSAGE_SIZE:
+                raise ValueError("Reply exceeds the size limit")
+    
+    if received < FRAME_HEADER.size:
+        raise ConnectionError("Connection closed before the reply was complete")
+    
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Reply of {length} bytes exceeds the size limit")
+    payload = bytearray(length)
+    if _recv_into_all(sock, memoryview(payload)) < length:
+        raise ConnectionError("Connection closed before the reply was complete")
+    return msgpack.unpackb(payload, raw=False)
+
+
+def _within_reply_limit(encoded_blocks: Iterable[bytes]) -> List[bytes]:
+    """
+    Take encoded blocks for a reply until the next would push it past MAX_MESSAGE_SIZE.
+    
+    The first block is always taken; MAX_MESSAGE_SIZE has room for any one
+    block. Peers ask again for the blocks left out.
+    """
+    taken = []
+    size = 1024  # Room for the reply envelope
+    for encoded in encoded_blocks:
+        size += len(encoded) + 1
+        if taken and size > MAX_MESSAGE_SIZE:
+            break
+        taken.append(encoded)
+    return taken
+
+
+def block_from_message(block_dict: Dict[str, Any]) -> Block:
+    """
+    Decode a block received in a message.
+    
+    Framed messages carry blocks as binary records, bare JSON as hex strings.
+    """
+    if isinstance(block_dict['hash'], str):
+        return Block.from_dict(block_dict)
+    return Block.from_record(block_dict)
+
+
+def transaction_from_message(tx_dict: Dict[str, Any]) -> Transaction:
+    """
+    Decode a transaction received in a message.
+    
+    Framed messages carry transactions as binary records, bare JSON as hex strings.
+    """
+    if isinstance(tx_dict['txid'], str):
+        return Transaction.from_dict(tx_dict)
+    return Transaction.from_record(tx_dict)
+
+
+class MessageBuffer:
+    """
+    Receive buffer splitting a client's input into messages.
+    
+    Messages are either length-prefixed frames from encode_frame or bare
+    JSON objects, as older clients send them. A frame header starts with a
+    zero byte for any size allowed here, so it never looks like JSON. Bare
+    JSON carries no length, so its bytes are scanned once, as they arrive,
+    for the closing brace, and the message is only parsed once that is found.
+    """
+    
+    def __init__(self):
+        """Initialize an empty buffer."""
+        self.data = bytearray()  # Received bytes not yet taken off as messages
+        # Scan of the bare JSON message at the start of the data: the offset
+        # scanned up to, the brace depth there and whether it is in a string
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+    
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """
+        Add received bytes and take off the messages they complete.
+        
+        Args:
+            data: Bytes received
+        
+        Returns:
+            The complete messages, in order
+        
+        Raises:
+            ValueError: If a message is malformed or exceeds MAX_MESSAGE_SIZE
+        """
+        self.data += data
+        messages = []
+        while True:
+            message = self._take_message()
+            if message is None:
+                return messages
+            messages.append(message)
+    
+    def _take_message(self) -> Optional[Dict[str, Any]]:
+        """Take the first message off the data, or return None if it is not complete yet."""
+        data = self.data
+        if not self._scanned:
+            start = _NON_WHITESPACE.search(data)
+            del data[:start.start() if start else len(data)]
+            if not data:
+                return None
+        
+        if data[:1] != b'{':
+            if len(data) < FRAME_HEADER.size:
+                return None
+            (length,) = FRAME_HEADER.unpack_from(data)
+            if length > MAX_MESSAGE_SIZE:
+                raise ValueError(f"Message of {length} bytes exceeds the size limit")
+            end = FRAME_HEADER.size + length
+            if len(data) < end:
+                return None
+            with memoryview(data)[FRAME_HEADER.size:end] as payload:
+                message = msgpack.unpackb(payload, raw=False)
+            del data[:end]
+            return message
+        
+        end = self._scan_json()
+        if end is None:
+            if len(data) > MAX_MESSAGE_SIZE:
+                raise ValueError("Message exceeds the size limit")
+            return None
+        with memoryview(data)[:end] as payload:
+            message = orjson.loads(payload)
+        del data[:end]
+        return message
+    
+    def _scan_json(self) -> Optional[int]:
+        """
+        Continue scanning the bare JSON message at the start of the data.
+        
+        Returns:
+            The offset just past its closing brace, or None if that has not
+            been received yet
+        """
+        data = self.data
+        pos, depth, in_string = self._scanned, self._depth, self._in_string
+        while True:
+            match = (_JSON_STRING_TOKEN if in_string else _JSON_TOKEN).search(data, pos)
+            if match is None:
+                pos = len(data)
+                break
+            token = match.group()
+            pos = match.end()
+            if in_string:
+                if token == b'\\':
+                    if pos == len(data):
+                        pos -= 1  # Scan the escape again once the byte it escapes arrives
+                        break
+                    pos += 1
+                else:
+                    in_string = False
+            elif token == b'"':
+                in_string = True
+            elif token == b'{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self._scanned, self._depth, self._in_string = 0, 0, False
+                    return pos
+        
+        self._scanned, self._depth, self._in_string = pos, depth, in_string
+        return None
+
+
+class ClientConnection:
+    """An open client connection served by the node, with its unhandled input."""
+    
+    def __init__(self, sock: socket.socket, addr: tuple):
+        """
+        Initialize a client connection.
+        
+        Args:
+            sock: Connected non-blocking socket
+            addr: Client address
+        """
+        self.sock = sock
+        self.addr = addr
+        self.buffer = MessageBuffer()  # Received bytes not yet handled as messages
+
+
 class Message:
     """Message types for P2P communication."""
     PING = "ping"
@@ -33,6 +361,8 @@ class Message:
     PEERS = "peers"
     GET_BLOCKS = "get_blocks"
     BLOCKS = "blocks"
+    GET_HEIGHT = "get_height"
+    HEIGHT = "height"
     NEW_BLOCK = "new_block"
     NEW_TRANSACTION = "new_transaction"
 
@@ -79,11 +409,137 @@ class Peer:
         )
 
 
+class PeerConnectionPool:
+    """
+    Connections to peers, kept open for reuse by later messages.
+    
+    A connection carries one message at a time and is put back once it has
+    been sent and any reply received, so the next message to that peer
+    skips the TCP handshake. Requests ask for a framed reply, which leaves
+    the connection open; nodes that predate framing reply with bare JSON
+    and close it, which is noticed before the connection would be reused.
+    """
+    
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS):
+        """
+        Initialize the pool.
+        
+        Args:
+            max_idle: Open connections kept per peer
+        """
+        self._idle: Dict[Peer, List[socket.socket]] = {}
+        self._max_idle = max_idle
+        self._lock = threading.Lock()
+        self._closed = False
+    
+    def request(self, peer: Peer, message: Dict[str, Any], timeout: float = 5) -> Dict[str, Any]:
+        """
+        Send a request to a peer and receive its reply.
+        
+        Args:
+            peer: Peer to ask
+            message: Request message
+            timeout: Seconds each socket operation may take
+        
+        Returns:
+            The reply
+        """
+        return self._exchange(peer, orjson.dumps(dict(message, framed=True)), timeout, True)
+    
+    def send(self, peer: Peer, data: bytes, timeout: float = 5) -> None:
+        """
+        Send an encoded message that has no reply to a peer.
+        
+        Args:
+            peer: Peer to send to
+            data: Encoded message
+            timeout: Seconds each socket operation may take
+        """
+        self._exchange(peer, data, timeout, False)
+    
+    def discard(self, peer: Peer) -> None:
+        """Close the idle connections to a peer."""
+        with self._lock:
+            idle = self._idle.pop(peer, [])
+        for sock in idle:
+            sock.close()
+    
+    def close(self) -> None:
+        """Close every idle connection and stop keeping connections."""
+        with self._lock:
+            self._closed = True
+            idle = [sock for socks in self._idle.values() for sock in socks]
+            self._idle.clear()
+        for sock in idle:
+            sock.close()
+    
+    def _exchange(self, peer: Peer, data: bytes, timeout: float, expect_reply: bool) -> Optional[Dict[str, Any]]:
+        """Send data to a peer and receive the reply if there is one, over a pooled connection."""
+        while True:
+            sock, reused = self._acquire(peer, timeout)
+            try:
+                sock.sendall(data)
+                reply = receive_reply(sock) if expect_reply else None
+            except socket.timeout:
+                sock.close()
+                raise
+            except OSError:
+                sock.close()
+                if reused:
+                    continue  # The peer closed the idle connection; try another
+                raise
+            except BaseException:
+                sock.close()
+                raise
+            
+            self._release(peer, sock)
+            return reply
+    
+    def _acquire(self, peer: Peer, timeout: float) -> Tuple[socket.socket, bool]:
+        """
+        Take an idle connection to a peer, or open a new one.
+        
+        Returns:
+            (socket, reused) where reused is True for an idle connection
+        """
+        while True:
+            with self._lock:
+                idle = self._idle.get(peer)
+                sock = idle.pop() if idle else None
+            if sock is None:
+                break
+            
+            # An idle connection should have nothing to read; if it does, the
+            # peer has closed it or sent something unexpected
+            try:
+                readable, _, _ = select.select([sock], [], [], 0)
+            except (OSError, ValueError):
+                readable = True
+            if not readable:
+                sock.settimeout(timeout)
+                return sock, True
+            sock.close()
+        
+        sock = socket.create_connection((peer.host, peer.port), timeout=timeout)
+        configure_socket(sock)
+        return sock, False
+    
+    def _release(self, peer: Peer, sock: socket.socket) -> None:
+        """Keep a connection for reuse, or close it if enough are kept."""
+        with self._lock:
+            idle = self._idle.setdefault(peer, [])
+            if not self._closed and len(idle) < self._max_idle:
+                idle.append(sock)
+                return
+        sock.close()
+
+
 class Node:
     """QBitcoin P2P network node."""
     
     def __init__(self, host: str = "0.0.0.0", port: int = DEFAULT_PORT, 
-                 data_dir: str = "data", seed_peers: List[Dict[str, Any]] = None):
+                 data_dir: str = "data", seed_peers: List[Dict[str, Any]] = None,
+                 blockchain: Optional[Blockchain] = None, store: Optional[BlockchainStore] = None):
         """
         Initialize a QBitcoin node.
         
@@ -92,12 +548,26 @@ class Node:
             port: Port to bind to
             data_dir: Directory for blockchain and wallet data
             seed_peers: List of seed peers to connect to
+            blockchain: Blockchain to share, loaded from the store if None
+            store: Store for the blockchain, shared with anything else saving
+                it, such as a miner; one is created in data_dir if None
         """
         self.host = host
         self.port = port
         self.data_dir = data_dir
+        # Known peers, changed only through _add_peer and _remove_peers under
+        # the lock. Readers iterate the tuple copy, which is replaced whole on
+        # every change, instead of the set other threads may be changing.
         self.peers: Set[Peer] = set()
-        self.blockchain = self._load_or_create_blockchain()
+        self._peers_snapshot: Tuple[Peer, ...] = ()
+        self._peers_lock = threading.RLock()
+        # Encoded get_peers replies by framing, replaced whenever the peers change
+        self._peers_replies: Dict[bool, bytes] = {}
+        # Known peers that rejected get_height, asked for their latest block instead;
+        # a peer leaves this set when it is removed or added again
+        self._height_unsupported: Set[Peer] = set()
+        self.store = store if store is not None else BlockchainStore(data_dir)
+        self.blockchain = blockchain if blockchain is not None else self._load_or_create_blockchain()
         self.wallet_manager = WalletManager(os.path.join(data_dir, "wallets"))
         
         # Create directories
@@ -105,6 +575,7 @@ class Node:
         os.makedirs(os.path.join(data_dir, "wallets"), exist_ok=True)
         
         # Load existing peers from disk first
+        self._peers_loaded = False
         self._load_peers()
         
         # Add seed peers from parameter or defaults
@@ -117,69 +588,127 @@ class Node:
                     print(f"Skipping seed peer {peer_dict['host']}:{peer_dict['port']} (matches our address)")
                     continue
                 new_peer = Peer(peer_dict['host'], int(peer_dict['port']))
-                self.peers.add(new_peer)
+                self._add_peer(new_peer)
                 print(f"Added seed peer: {new_peer}")
         
         # Setup server socket
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Accepted connections inherit these options from the start, including
+        # the receive buffer their TCP window is negotiated from
+        configure_socket(self.socket)
         
         # Flags
         self.running = False
         self.syncing = False
+        self.ready = threading.Event()  # Set once the node is listening and has synced
+        self._stop_event = threading.Event()  # Set when the node stops, waking waiting threads
         
         # Background threads
         self.server_thread: Optional[threading.Thread] = None
         self.peer_manager_thread: Optional[threading.Thread] = None
+        self.publisher_thread: Optional[threading.Thread] = None
+        self.chain_writer_thread: Optional[threading.Thread] = None
+        
+        # Blocks received from peers, added to the chain one at a time by the
+        # chain writer thread; None wakes the writer to stop
+        self.incoming_blocks: queue.Queue = queue.Queue(maxsize=MAX_INCOMING_BLOCKS)
+        
+        # New blocks waiting to be broadcast, in order; None wakes the publisher to stop
+        self.new_block_queue: queue.SimpleQueue = queue.SimpleQueue()
+        
+        # Worker threads for handling client messages and sending to peers,
+        # reused rather than started per connection or per send
+        self.pool = ThreadPoolExecutor(max_workers=MAX_PEERS, thread_name_prefix="qbit-io")
+        
+        # Open connections to peers, reused across pings, probes and broadcasts
+        self.conn_pool = PeerConnectionPool()
+        
+        # Client connections whose messages have been handled, waiting for the
+        # server thread to watch them again; a byte on the wakeup socket tells it
+        self._released_clients: queue.SimpleQueue = queue.SimpleQueue()
+        self._wakeup_writer: Optional[socket.socket] = None
     
     def _load_or_create_blockchain(self) -> Blockchain:
         """Load blockchain from disk or create a new one."""
-        blockchain_path = os.path.join(self.data_dir, "blockchain.json")
-        
-        if os.path.exists(blockchain_path):
-            try:
-                with open(blockchain_path, 'r') as f:
-                    blockchain_dict = json.load(f)
-                print(f"Loaded blockchain from {blockchain_path}")
-                return Blockchain.from_dict(blockchain_dict)
-            except Exception as e:
-                print(f"Error loading blockchain: {e}")
+        try:
+            blockchain = self.store.load()
+            if blockchain:
+                print(f"Loaded blockchain from {self.store.blocks_path}")
+                return blockchain
+        except Exception as e:
+            print(f"Error loading blockchain: {e}")
         
         # Create new blockchain
         print("Creating new blockchain")
         return Blockchain()
     
-    def _save_blockchain(self) -> None:
-        """Save blockchain to disk."""
-        blockchain_path = os.path.join(self.data_dir, "blockchain.json")
-        blockchain_dict = self.blockchain.to_dict()
-        
-        with open(blockchain_path, 'w') as f:
-            json.dump(blockchain_dict, f)
-        
-        print(f"Saved blockchain to {blockchain_path}")
+    def _save_blockchain(self, snapshot: bool = False) -> None:
+        """Save blockchain to disk, with a state snapshot if requested."""
+        self.store.save(self.blockchain, snapshot)
+        print(f"Saved blockchain to {self.store.blocks_path}")
     
     def _save_peers(self) -> None:
         """Save peers to disk."""
         peers_path = os.path.join(self.data_dir, "peers.json")
-        peers_list = [peer.to_dict() for peer in self.peers]
+        peers = self._peers_snapshot
+        replace_file(peers_path, orjson.dumps([peer.to_dict() for peer in peers]))
+        
+        print(f"Saved {len(peers)} peers to {peers_path}")
         
-        with open(peers_path, 'w') as f:
-            json.dump(peers_list, f)
+    def _add_peer(self, peer: Peer, max_peers: Optional[int] = None) -> bool:
+        """
+        Add a peer, dropping the cached get_peers replies.
+        
+        Args:
+            peer: Peer to add
+            max_peers: Number of known peers beyond which none are added, if any
         
-        print(f"Saved {len(self.peers)} peers to {peers_path}")
+        Returns:
+            True if the peer was added, False if already known or at the limit
+        """
+        with self._peers_lock:
+            if peer in self.peers or (max_peers is not None and len(self.peers) >= max_peers):
+                return False
+            self.peers.add(peer)
+            self._peers_snapshot = tuple(self.peers)
+            self._peers_replies = {}
+            self._height_unsupported.discard(peer)
+            return True
+    
+    def _add_peers(self, peers: Set[Peer]) -> None:
+        """Add several peers at once, dropping the cached get_peers replies."""
+        if not peers:
+            return
+        with self._peers_lock:
+            self.peers |= peers
+            self._peers_snapshot = tuple(self.peers)
+            self._peers_replies = {}
+            self._height_unsupported -= peers
+    
+    def _remove_peers(self, peers: Set[Peer]) -> None:
+        """Remove peers, dropping the cached get_peers replies."""
+        if not peers:
+            return
+        with self._peers_lock:
+            self.peers -= peers
+            self._peers_snapshot = tuple(self.peers)
+            self._peers_replies = {}
+            self._height_unsupported -= peers
     
     def _load_peers(self) -> None:
-        """Load peers from disk."""
+        """Load peers from disk, once; later calls do nothing."""
+        if self._peers_loaded:
+            return
+        self._peers_loaded = True
         peers_path = os.path.join(self.data_dir, "peers.json")
         
         if os.path.exists(peers_path):
             try:
-                with open(peers_path, 'r') as f:
-                    peers_list = json.load(f)
+                with open(peers_path, 'rb') as f:
+                    peers_list = orjson.loads(f.read())
                 
-                for peer_dict in peers_list:
-                    self.peers.add(Peer.from_dict(peer_dict))
+                self._add_peers({Peer.from_dict(peer_dict) for peer_dict in peers_list})
                 
                 print(f"Loaded {len(self.peers)} peers from {peers_path}")
             except Exception as e:
@@ -192,6 +721,7 @@ class Node:
             return
         
         self.running = True
+        self._stop_event.clear()
         
         # Bind socket
         try:
@@ -203,12 +733,9 @@ class Node:
             self.running = False
             return
         
-        # Load peers from disk
-        self._load_peers()
-        
-        # Debug: Print all peers after loading
-        print(f"Loaded {len(self.peers)} peers from disk.")
-        for peer in self.peers:
+        # Debug: Print all peers known at startup
+        print(f"Starting with {len(self.peers)} known peers.")
+        for peer in self._peers_snapshot:
             print(f"Peer loaded: {peer}")
         
         # Start threads
@@ -220,8 +747,17 @@ class Node:
         self.peer_manager_thread.daemon = True
         self.peer_manager_thread.start()
         
+        self.publisher_thread = threading.Thread(target=self._publisher_loop)
+        self.publisher_thread.daemon = True
+        self.publisher_thread.start()
+        
+        self.chain_writer_thread = threading.Thread(target=self._chain_writer_loop)
+        self.chain_writer_thread.daemon = True
+        self.chain_writer_thread.start()
+        
         # Initial blockchain sync
         self._sync_blockchain()
+        self.ready.set()
     
     def stop(self) -> None:
         """Stop the node server and background tasks."""
@@ -229,9 +765,11 @@ class Node:
             return
         
         self.running = False
+        self._stop_event.set()
+        self.ready.clear()
         
         # Save data
-        self._save_blockchain()
+        self._save_blockchain(snapshot=True)
         self._save_peers()
         
         # Close socket
@@ -247,54 +785,164 @@ class Node:
         if self.peer_manager_thread:
             self.peer_manager_thread.join(timeout=1.0)
         
+        if self.publisher_thread:
+            self.new_block_queue.put(None)
+            self.publisher_thread.join(timeout=1.0)
+        
+        if self.chain_writer_thread:
+            try:
+                self.incoming_blocks.put_nowait(None)
+            except queue.Full:
+                pass  # The writer checks running after its current block
+            self.chain_writer_thread.join(timeout=1.0)
+        
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.conn_pool.close()
+        
         print("Node stopped")
     
     def _server_loop(self) -> None:
-        """Main server loop to accept incoming connections."""
-        while self.running:
-            try:
-                client_socket, addr = self.socket.accept()
-                client_thread = threading.Thread(
-                    target=self._handle_client,
-                    args=(client_socket, addr)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-            except Exception as e:
-                if self.running:
-                    print(f"Server error: {e}")
-                    time.sleep(1)
+        """
+        Serve all client connections from a single thread.
     
-    def _handle_client(self, client_socket: socket.socket, addr: tuple) -> None:
-        """Handle an incoming client connection."""
+        The listening socket and every open client connection are registered
+        with a selector, and only sockets it reports ready are accepted from
+        or read, so an idle connection costs no thread. Clients may keep the
+        connection open and send several messages on it, one after another,
+        framed or as bare JSON. Complete messages are handled on the worker
+        pool, and the connection is watched again once they have been, so a
+        client's messages are handled in order. Replies are framed when the
+        request asks for it, bare JSON otherwise.
+        """
+        selector = selectors.DefaultSelector()
+        self.socket.setblocking(False)
+        selector.register(self.socket, selectors.EVENT_READ)
+        
+        wakeup_reader, self._wakeup_writer = socket.socketpair()
+        wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        selector.register(wakeup_reader, selectors.EVENT_READ)
+        
+        try:
+            while self.running:
+                try:
+                    events = selector.select(timeout=SELECT_TIMEOUT)
+                except Exception as e:
+                    if self.running:
+                        print(f"Server error: {e}")
+                        time.sleep(1)
+                    continue
+                
+                for key, _ in events:
+                    if key.fileobj is self.socket:
+                        self._accept_client(selector)
+                    elif key.fileobj is wakeup_reader:
+                        self._watch_released_clients(selector, wakeup_reader)
+                    else:
+                        self._read_client(selector, key.data)
+        
+        finally:
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    key.data.sock.close()
+            selector.close()
+            self._wakeup_writer.close()
+            wakeup_reader.close()
+    
+    def _accept_client(self, selector: selectors.BaseSelector) -> None:
+        """Accept a pending connection and register it with the selector."""
+        try:
+            client_socket, addr = self.socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return  # Another event already took it
+        except Exception as e:
+            if self.running:
+                print(f"Server error: {e}")
+            return
+        
         print(f"New connection from {addr[0]}:{addr[1]}")
+        configure_socket(client_socket)
+        client_socket.setblocking(False)
+        selector.register(client_socket, selectors.EVENT_READ, ClientConnection(client_socket, addr))
+    
+    def _read_client(self, selector: selectors.BaseSelector, connection: ClientConnection) -> None:
+        """
+        Read what a client has sent and pass any complete messages to the pool.
         
+        The connection is not watched while its messages are being handled.
+        It is closed when the client closes it or on any error.
+        """
+        client_socket = connection.sock
         try:
-            # Receive message
-            data = client_socket.recv(1024 * 1024)  # 1MB max
-            if not data:
+            data = client_socket.recv(1024 * 1024)
+            if data:
+                messages = connection.buffer.feed(data)
+                if messages:
+                    selector.unregister(client_socket)
+                    self.pool.submit(self._handle_messages, connection, messages)
                 return
             
-            # Parse message
-            message = json.loads(data.decode('utf-8'))
-            
-            # Handle message
-            if message['type'] == Message.PING:
-                self._handle_ping(client_socket, message)
-            elif message['type'] == Message.GET_PEERS:
-                self._handle_get_peers(client_socket, message)
-            elif message['type'] == Message.GET_BLOCKS:
-                self._handle_get_blocks(client_socket, message)
-            elif message['type'] == Message.NEW_BLOCK:
-                self._handle_new_block(client_socket, message)
-            elif message['type'] == Message.NEW_TRANSACTION:
-                self._handle_new_transaction(client_socket, message)
-        
+        except (BlockingIOError, InterruptedError):
+            return
         except Exception as e:
             print(f"Error handling client: {e}")
         
-        finally:
+        selector.unregister(client_socket)
+        client_socket.close()
+    
+    def _handle_messages(self, connection: ClientConnection, messages: List[Dict[str, Any]]) -> None:
+        """
+        Handle a client's messages in order on a pool thread.
+        
+        Replies are sent with a blocking timeout, as handlers send them
+        whole; the connection is then handed back to the server thread, or
+        closed on any error.
+        """
+        client_socket = connection.sock
+        try:
+            client_socket.settimeout(CLIENT_SEND_TIMEOUT)
+            for message in messages:
+                self._dispatch_message(client_socket, message)
+            client_socket.setblocking(False)
+        except Exception as e:
+            print(f"Error handling client: {e}")
             client_socket.close()
+            return
+        
+        self._released_clients.put(connection)
+        try:
+            self._wakeup_writer.send(b'\0')
+        except OSError:
+            pass  # A wakeup is already pending, or the server has stopped
+    
+    def _watch_released_clients(self, selector: selectors.BaseSelector, wakeup_reader: socket.socket) -> None:
+        """Register client connections handed back by the pool with the selector again."""
+        try:
+            wakeup_reader.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+        
+        while True:
+            try:
+                connection = self._released_clients.get_nowait()
+            except queue.Empty:
+                return
+            selector.register(connection.sock, selectors.EVENT_READ, connection)
+    
+    def _dispatch_message(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
+        """Handle a message received from a client."""
+        if message['type'] == Message.PING:
+            self._handle_ping(client_socket, message)
+        elif message['type'] == Message.GET_PEERS:
+            self._handle_get_peers(client_socket, message)
+        elif message['type'] == Message.GET_BLOCKS:
+            self._handle_get_blocks(client_socket, message)
+        elif message['type'] == Message.GET_HEIGHT:
+            self._handle_get_height(client_socket, message)
+        elif message['type'] == Message.NEW_BLOCK:
+            self._handle_new_block(client_socket, message)
+        elif message['type'] == Message.NEW_TRANSACTION:
+            self._handle_new_transaction(client_socket, message)
     
     def _handle_ping(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
         """Handle a ping message."""
@@ -302,25 +950,29 @@ class Node:
             'type': Message.PONG,
             'timestamp': time.time()
         }
-        client_socket.sendall(json.dumps(response).encode('utf-8'))
+        self._send_reply(client_socket, message, response)
         
         # Add peer if the message contains host and port
         if 'host' in message and 'port' in message:
             peer = Peer(message['host'], message['port'])
-            if peer not in self.peers and len(self.peers) < MAX_PEERS:
-                self.peers.add(peer)
+            if self._add_peer(peer, max_peers=MAX_PEERS):
                 print(f"Added new peer: {peer}")
         else:
             print("Received ping without host/port information")
     
     def _handle_get_peers(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
-        """Handle a get_peers message."""
-        peers_list = [peer.to_dict() for peer in self.peers]
-        response = {
-            'type': Message.PEERS,
-            'peers': peers_list
-        }
-        client_socket.sendall(json.dumps(response).encode('utf-8'))
+        """Handle a get_peers message, reusing the encoded reply until the peers change."""
+        framed = bool(message.get('framed'))
+        replies = self._peers_replies
+        data = replies.get(framed)
+        if data is None:
+            peers_list = [peer.to_dict() for peer in self._peers_snapshot]
+            response = {
+                'type': Message.PEERS,
+                'peers': peers_list
+            }
+            data = replies[framed] = self._encode_reply(message, response)
+        client_socket.sendall(data)
     
     def _handle_get_blocks(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
         """Handle a get_blocks message."""
@@ -333,97 +985,162 @@ class Node:
         if start_index > end_index:
             start_index = end_index
         
-        # Get blocks
-        blocks = []
-        for i in range(start_index, end_index + 1):
-            blocks.append(self.blockchain.chain[i].to_dict())
+        # Send the blocks' cached encodings rather than encoding them again;
+        # framed replies take logged blocks straight from the block log
+        chain = self.blockchain.chain
+        indices = range(start_index, end_index + 1)
+        response = {
+            'type': Message.BLOCKS
+        }
         
-        # Send response
+        if message.get('framed'):
+            packed_record = getattr(chain, 'packed_record', None) or (lambda i: chain[i].to_packed_record())
+            encoded = _within_reply_limit(map(packed_record, indices))
+            blocks = msgpack.Packer().pack_array_header(len(encoded)) + b''.join(encoded)
+            client_socket.sendall(encode_frame(response, packed={'blocks': blocks}))
+        else:
+            blocks = b'[' + b','.join(_within_reply_limit(chain[i].to_json() for i in indices)) + b']'
+            client_socket.sendall(encode_json(response, encoded={'blocks': blocks}))
+            # Such clients read a blocks reply until end of file
+            client_socket.shutdown(socket.SHUT_WR)
+    
+    def _handle_get_height(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
+        """Handle a get_height message."""
         response = {
-            'type': Message.BLOCKS,
-            'blocks': blocks
+            'type': Message.HEIGHT,
+            'height': len(self.blockchain.chain) - 1
         }
-        client_socket.sendall(json.dumps(response).encode('utf-8'))
+        self._send_reply(client_socket, message, response)
+    
+    def _send_reply(self, client_socket: socket.socket, request: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Send the reply to a request."""
+        client_socket.sendall(self._encode_reply(request, response))
+    
+    def _encode_reply(self, request: Dict[str, Any], response: Dict[str, Any]) -> bytes:
+        """
+        Encode the reply to a request.
+        
+        Requests marked 'framed' get a framed reply and the connection stays
+        open for more. Other clients get bare JSON.
+        """
+        if request.get('framed'):
+            return encode_frame(response)
+        return encode_json(response)
     
     def _handle_new_block(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
         """Handle a new_block message."""
         block_dict = message['block']
         
         # Convert to Block object
-        block = Block.from_dict(block_dict)
+        block = block_from_message(block_dict)
         
-        print(f"Received block {block.index} with hash {block.hash[:8]}... from peer")
+        print(f"Received block {block.index} with hash {block.hash.hex()[:8]}... from peer")
+        
+        # Leave validation to the chain writer, so this worker is free at once
+        # and blocks from different peers cannot race each other onto the chain
+        try:
+            self.incoming_blocks.put_nowait(block)
+        except queue.Full:
+            print(f"Ignoring block {block.index} - too many blocks waiting to be added")
+    
+    def _chain_writer_loop(self) -> None:
+        """Add blocks received from peers to the chain, one at a time, until told to stop."""
+        unsaved = False
+        while self.running:
+            block = self.incoming_blocks.get()
+            if block is None:
+                break
+            unsaved |= self._add_received_block(block)
+            
+            # Save once the queue is drained rather than after every block
+            if unsaved and self.incoming_blocks.empty():
+                self._save_blockchain()
+                unsaved = False
+    
+    def _add_received_block(self, block: Block) -> bool:
+        """
+        Validate a block received from a peer and add it to the chain.
+        
+        Args:
+            block: Block to add
         
+        Returns:
+            True if the block was added and queued for broadcast
+        """
         # Validate block (simplified)
         if block.index != len(self.blockchain.chain):
             print(f"Ignoring block {block.index} - expected index {len(self.blockchain.chain)}")
-            return  # Ignore block with wrong index
+            return False  # Ignore block with wrong index
         
         if block.previous_hash != self.blockchain.get_latest_block().hash:
             print(f"Ignoring block {block.index} - wrong previous hash")
-            return  # Ignore block with wrong previous hash
+            return False  # Ignore block with wrong previous hash
         
         # Add block to blockchain
-        self.blockchain.chain.append(block)
+        if not self.blockchain.add_block(block):
+            print(f"Ignoring block {block.index} - invalid proof of work, txid or signature")
+            return False
         print(f"💠 Added new block {block.index} from peer - blockchain height: {len(self.blockchain.chain)}")
-        print(f"   Block hash: {block.hash}")
+        print(f"   Block hash: {block.hash.hex()}")
         print(f"   Transactions: {len(block.transactions)} | Timestamp: {datetime.fromtimestamp(block.timestamp)}")
         
-        # Save blockchain
-        self._save_blockchain()
-        
         # Propagate to peers
-        self._broadcast_new_block(block)
+        self.new_block_queue.put(block)
+        return True
     
     def _handle_new_transaction(self, client_socket: socket.socket, message: Dict[str, Any]) -> None:
         """Handle a new_transaction message."""
         tx_dict = message['transaction']
         
         # Convert to Transaction object
-        tx = Transaction.from_dict(tx_dict)
+        tx = transaction_from_message(tx_dict)
         
         # Validate and add transaction
         if self.blockchain.add_transaction(tx):
-            print(f"Added new transaction {tx.txid} from peer")
+            print(f"Added new transaction {tx.txid.hex()} from peer")
             
             # Propagate to peers
             self._broadcast_new_transaction(tx)
     
     def _peer_manager_loop(self) -> None:
         """Background loop for peer management."""
-        last_ping_time = 0
-        last_sync_time = 0
+        next_ping_time = next_sync_time = time.monotonic()
         
         while self.running:
-            current_time = time.time()
+            current_time = time.monotonic()
             
             # Ping peers periodically
-            if current_time - last_ping_time > PING_INTERVAL:
+            if current_time >= next_ping_time:
                 self._ping_peers()
-                last_ping_time = current_time
+                next_ping_time = current_time + PING_INTERVAL
             
             # Sync blockchain periodically
-            if current_time - last_sync_time > SYNC_INTERVAL:
+            if current_time >= next_sync_time:
                 self._sync_blockchain()
-                last_sync_time = current_time
+                next_sync_time = current_time + SYNC_INTERVAL
             
-            # Sleep
-            time.sleep(1)
+            # Sleep until the next task is due, waking at once if the node stops
+            timeout = min(next_ping_time, next_sync_time) - time.monotonic()
+            if self._stop_event.wait(max(0.1, timeout)):
+                break
     
     def _ping_peers(self) -> None:
         """Ping all peers to check if they're alive."""
         dead_peers = set()
         
-        for peer in self.peers:
-            if not self._send_ping(peer):
+        # Ping every peer at once, so this takes the slowest peer's round trip
+        peers = self._peers_snapshot
+        for peer, alive in zip(peers, self.pool.map(self._send_ping, peers)):
+            if not alive:
                 print(f"Peer {peer} is dead")
                 dead_peers.add(peer)
+                self.conn_pool.discard(peer)
         
         # Remove dead peers
-        self.peers -= dead_peers
+        self._remove_peers(dead_peers)
         
         # Request new peers if needed
-        if len(self.peers) < MAX_PEERS / 2:
+        if len(self._peers_snapshot) < MAX_PEERS / 2:
             self._discover_peers()
     
     def _send_ping(self, peer: Peer) -> bool:
@@ -438,24 +1155,13 @@ class Node:
         """
         try:
             print(f"Attempting to ping peer: {peer}")
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(5)
-            client.connect((peer.host, peer.port))
-            
             message = {
                 'type': Message.PING,
                 'host': self.host,
                 'port': self.port
             }
             
-            client.sendall(json.dumps(message).encode('utf-8'))
-            
-            response = client.recv(1024)
-            if not response:
-                print(f"No response from peer: {peer}")
-                return False
-            
-            response_data = json.loads(response.decode('utf-8'))
+            response_data = self.conn_pool.request(peer, message)
             if response_data['type'] == Message.PONG:
                 print(f"Received PONG from peer: {peer}")
                 return True
@@ -466,57 +1172,54 @@ class Node:
             print(f"Error pinging peer {peer}: {e}")
             return False
         
-        finally:
-            client.close()
-    
     def _discover_peers(self) -> None:
-        """Discover new peers by querying existing peers."""
-        if not self.peers:
+        """Discover new peers by querying several existing peers at once."""
+        peers = self._peers_snapshot
+        if not peers:
             print("No peers available for discovery")
             return
         
-        # Select a random peer
-        peer = random.choice(list(self.peers))
-        print(f"Attempting to discover peers through: {peer}")
+        # Ask a few random peers in parallel, so one round takes a single
+        # round trip and can learn enough peers to reach the target
+        sample = random.sample(peers, k=min(DISCOVERY_FANOUT, len(peers)))
+        print(f"Attempting to discover peers through: {', '.join(map(str, sample))}")
+        
+        for peer_dicts in self.pool.map(self._query_peers, sample):
+            for peer_dict in peer_dicts:
+                new_peer = Peer(peer_dict['host'], peer_dict['port'])
+                if self._add_peer(new_peer, max_peers=MAX_PEERS):
+                    print(f"Discovered new peer: {new_peer}")
+                else:
+                    print(f"Skipping peer {new_peer} (already known or MAX_PEERS reached)")
+    
+    def _query_peers(self, peer: Peer) -> List[Dict[str, Any]]:
+        """
+        Ask a peer for the peers it knows.
+        
+        Args:
+            peer: Peer to ask
         
+        Returns:
+            The suggested peers as dicts, empty if the request failed
+        """
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(5)
-            client.connect((peer.host, peer.port))
-            
             message = {
                 'type': Message.GET_PEERS
             }
             
-            client.sendall(json.dumps(message).encode('utf-8'))
-            
-            response = client.recv(1024 * 10)  # 10KB max
-            if not response:
-                print(f"No response from peer {peer} during peer discovery")
-                return
-            
-            response_data = json.loads(response.decode('utf-8'))
+            response_data = self.conn_pool.request(peer, message)
             if response_data['type'] == Message.PEERS:
                 print(f"Received {len(response_data['peers'])} peer suggestions from {peer}")
-                for peer_dict in response_data['peers']:
-                    new_peer = Peer(peer_dict['host'], peer_dict['port'])
-                    if new_peer not in self.peers and len(self.peers) < MAX_PEERS:
-                        self.peers.add(new_peer)
-                        print(f"Discovered new peer: {new_peer}")
-                    else:
-                        print(f"Skipping peer {new_peer} (already known or MAX_PEERS reached)")
-            else:
-                print(f"Unexpected response type during peer discovery: {response_data['type']}")
+                return response_data['peers']
+            print(f"Unexpected response type during peer discovery: {response_data['type']}")
         
         except Exception as e:
             print(f"Error discovering peers through {peer}: {e}")
-        
-        finally:
-            client.close()
+        return []
     
     def _sync_blockchain(self) -> None:
         """Synchronize blockchain with peers."""
-        if not self.peers or self.syncing:
+        if not self._peers_snapshot or self.syncing:
             return
         
         self.syncing = True
@@ -526,8 +1229,9 @@ class Node:
             best_peer = None
             max_height = len(self.blockchain.chain) - 1
             
-            for peer in self.peers:
-                height = self._get_peer_blockchain_height(peer)
+            # Ask every peer at once, so this takes the slowest peer's round trip
+            peers = self._peers_snapshot
+            for peer, height in zip(peers, self.pool.map(self._get_peer_blockchain_height, peers)):
                 print(f"Peer {peer} blockchain height: {height}")
                 if height > max_height:
                     max_height = height
@@ -537,7 +1241,12 @@ class Node:
             if best_peer and max_height > len(self.blockchain.chain) - 1:
                 print(f"🔄 Found peer {best_peer} with longer blockchain (height: {max_height})")
                 print(f"   Downloading {max_height - (len(self.blockchain.chain) - 1)} new blocks...")
-                success = self._download_blocks(best_peer, len(self.blockchain.chain) - 1, max_height)
+                # A reply may hold fewer blocks than asked for, to stay within
+                # MAX_MESSAGE_SIZE, so keep asking while blocks are being added
+                success = False
+                while (len(self.blockchain.chain) - 1 < max_height
+                       and self._download_blocks(best_peer, len(self.blockchain.chain) - 1, max_height)):
+                    success = True
                 if success:
                     print(f"✅ Blockchain sync complete - new height: {len(self.blockchain.chain)}")
                 else:
@@ -552,12 +1261,30 @@ class Node:
             self.syncing = False
     
     def _get_peer_blockchain_height(self, peer: Peer) -> int:
-        """Get the blockchain height of a peer."""
+        """
+        Get the blockchain height of a peer.
+        
+        Peers are asked for just their height. Older nodes close the
+        connection on get_height without replying; when a peer does that, or
+        answers with another message type, it is asked for its latest block
+        instead, and if that works it is asked that way until it is removed
+        or added again. Other failures, such as a timeout or a reset
+        connection, leave get_height to be tried again next time.
+        """
+        if peer not in self._height_unsupported:
+            message = {
+                'type': Message.GET_HEIGHT
+            }
+            try:
+                response_data = self.conn_pool.request(peer, message)
+                if response_data['type'] in (Message.HEIGHT, Message.BLOCKS):
+                    return self._reply_height(response_data)
+            except NoReplyError:
+                pass  # Rejected; ask for the latest block instead
+            except Exception:
+                return 0
+        
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(5)
-            client.connect((peer.host, peer.port))
-            
             # Request only the latest block
             message = {
                 'type': Message.GET_BLOCKS,
@@ -565,70 +1292,53 @@ class Node:
                 'end_index': -1
             }
             
-            client.sendall(json.dumps(message).encode('utf-8'))
-            
-            response = client.recv(1024 * 10)  # 10KB max
-            if not response:
-                return 0
-            
-            response_data = json.loads(response.decode('utf-8'))
-            if response_data['type'] == Message.BLOCKS and response_data['blocks']:
-                latest_block = response_data['blocks'][0]
-                return latest_block['index']
-            
-            return 0
+            response_data = self.conn_pool.request(peer, message)
+            if response_data['type'] == Message.BLOCKS:
+                with self._peers_lock:
+                    if peer in self.peers:
+                        self._height_unsupported.add(peer)
+            return self._reply_height(response_data)
         
         except Exception:
             return 0
         
-        finally:
-            client.close()
+    @staticmethod
+    def _reply_height(response_data: Dict[str, Any]) -> int:
+        """Get a peer's height from its reply to get_height or get_blocks, 0 if it has none."""
+        if response_data['type'] == Message.HEIGHT:
+            return response_data['height']
+        if response_data['type'] == Message.BLOCKS and response_data['blocks']:
+            latest_block = response_data['blocks'][0]
+            return latest_block['index']
+        
+        return 0
     
     def _download_blocks(self, peer: Peer, start_index: int, end_index: int) -> bool:
         """Download blocks from a peer."""
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(30)  # Longer timeout for block download
-            client.connect((peer.host, peer.port))
-            
             message = {
                 'type': Message.GET_BLOCKS,
                 'start_index': start_index,
                 'end_index': end_index
             }
             
-            client.sendall(json.dumps(message).encode('utf-8'))
-            
-            # Receive blocks (large response)
-            chunks = []
-            while True:
-                chunk = client.recv(1024 * 1024)  # 1MB chunks
-                if not chunk:
-                    break
-                chunks.append(chunk)
-            
-            data = b''.join(chunks)
-            if not data:
-                print(f"No data received from peer {peer} when downloading blocks")
-                return False
-            
-            response_data = json.loads(data.decode('utf-8'))
+            # Longer timeout for the block download
+            response_data = self.conn_pool.request(peer, message, timeout=30)
             if response_data['type'] == Message.BLOCKS and response_data['blocks']:
                 print(f"Received {len(response_data['blocks'])} blocks from peer {peer}")
                 blocks_added = 0
                 
                 # Process blocks
                 for block_dict in response_data['blocks']:
-                    block = Block.from_dict(block_dict)
+                    block = block_from_message(block_dict)
                     
                     # Simple validation
-                    if block.index == len(self.blockchain.chain):
-                        self.blockchain.chain.append(block)
+                    if self.blockchain.add_block(block):
                         blocks_added += 1
-                        print(f"📦 Added block {block.index} with hash {block.hash[:8]}... from peer {peer}")
+                        print(f"📦 Added block {block.index} with hash {block.hash.hex()[:8]}... from peer {peer}")
                         print(f"   Transactions: {len(block.transactions)} | Timestamp: {datetime.fromtimestamp(block.timestamp)}")
                     else:
-                        print(f"⚠️ Skipping block {block.index} - expected index {len(self.blockchain.chain)}")
+                        print(f"⚠️ Skipping block {block.index} - invalid or does not extend local chain (expected index {len(self.blockchain.chain)})")
                 
                 # Save blockchain
                 self._save_blockchain()
@@ -642,42 +1352,49 @@ class Node:
             print(f"Error downloading blocks: {e}")
             return False
         
-        finally:
-            client.close()
+    def _publisher_loop(self) -> None:
+        """Broadcast queued new blocks to peers, off the threads that produce them."""
+        while self.running:
+            block = self.new_block_queue.get()
+            if block is None:
+                break
+            self._broadcast_new_block(block)
     
     def _broadcast_new_block(self, block: Block) -> None:
-        """Broadcast a new block to all peers."""
+        """Broadcast a new block to all peers as a frame."""
         message = {
-            'type': Message.NEW_BLOCK,
-            'block': block.to_dict()
+            'type': Message.NEW_BLOCK
         }
-        
-        for peer in self.peers:
-            try:
-                client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                client.settimeout(5)
-                client.connect((peer.host, peer.port))
-                client.sendall(json.dumps(message).encode('utf-8'))
-                client.close()
-            except Exception:
-                pass
+        data = encode_frame(message, packed={'block': block.to_packed_record()})
+        # Waiting keeps successive blocks from overtaking each other
+        wait(self._send_to_peers(data), timeout=CLIENT_SEND_TIMEOUT)
     
     def _broadcast_new_transaction(self, transaction: Transaction) -> None:
-        """Broadcast a new transaction to all peers."""
+        """Broadcast a new transaction to all peers as a frame."""
         message = {
-            'type': Message.NEW_TRANSACTION,
-            'transaction': transaction.to_dict()
+            'type': Message.NEW_TRANSACTION
         }
+        data = encode_frame(message, packed={'transaction': transaction.to_packed_record()})
+        self._send_to_peers(data)
         
-        for peer in self.peers:
-            try:
-                client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                client.settimeout(5)
-                client.connect((peer.host, peer.port))
-                client.sendall(json.dumps(message).encode('utf-8'))
-                client.close()
-            except Exception:
-                pass
+    def _send_to_peers(self, data: bytes) -> List[Future]:
+        """
+        Send a message to every peer concurrently on the worker pool.
+        
+        Args:
+            data: Encoded message
+        
+        Returns:
+            One future per peer, done when the send has finished or failed
+        """
+        return [self.pool.submit(self._send_to_peer, peer, data) for peer in self._peers_snapshot]
+    
+    def _send_to_peer(self, peer: Peer, data: bytes) -> None:
+        """Send a message to one peer, ignoring failures."""
+        try:
+            self.conn_pool.send(peer, data)
+        except Exception:
+            pass
     
     def add_transaction(self, transaction: Transaction) -> bool:
         """
@@ -0,0 +1,419 @@
+"""
+Blockchain persistence for QBitcoin.
+
+Blocks are stored in an append-only log of length-prefixed msgpack records,
+so saving after a new block only writes that block. An index file holds the
+log offset of each block, which lets a loaded chain stay memory-mapped and
+decode blocks only when they are accessed. State that changes independently
+of the blocks (difficulty, pending transactions) lives in a small JSON file
+next to the log, and a periodic snapshot of the replayed state (balances,
+difficulty) means loading only replays the blocks logged after it.
+"""
+
+import os
+import mmap
+import array
+import struct
+import tempfile
+import threading
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+import msgpack
+import orjson
+from .blockchain import Blockchain, Block, Transaction
+
+BLOCKS_FILENAME = "blockchain.dat"
+INDEX_FILENAME = "blockchain.idx"
+SNAPSHOT_FILENAME = "snapshot.dat"
+STATE_FILENAME = "state.json"
+LEGACY_FILENAME = "blockchain.json"  # Monolithic JSON format, imported on first load
+
+RECORD_HEADER = struct.Struct('<I')  # Length prefix of each block record
+OFFSET_TYPECODE = 'Q'  # Index entries: uint64 log offset per block height
+SNAPSHOT_INTERVAL = 100  # Blocks logged between state snapshots
+
+
+def replace_file(path: str, data: bytes) -> None:
+    """
+    Write a file through a temporary file so readers never see partial data.
+    
+    The data is synced to disk before the rename, so a crash leaves either
+    the old file or the complete new one. The file is created readable by
+    its owner only.
+    
+    Args:
+        path: File to write
+        data: New contents
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _decode_record(data, offset: int) -> Tuple[Block, int]:
+    """
+    Decode the block record at an offset of the log.
+    
+    Returns:
+        (block, end) where end is the offset just past the record
+    """
+    (length,) = RECORD_HEADER.unpack_from(data, offset)
+    start = offset + RECORD_HEADER.size
+    end = start + length
+    record = msgpack.unpackb(data[start:end], raw=False)
+    
+    # Records from before the binary layout hold hex strings
+    if isinstance(record['hash'], str):
+        return Block.from_dict(record), end
+    return Block.from_record(record), end
+
+
+class MappedChain(Sequence):
+    """
+    Block sequence backed by a memory-mapped block log.
+    
+    Logged blocks are decoded from the map each time they are accessed rather
+    than kept alive; blocks appended after loading are held in memory.
+    """
+    
+    def __init__(self, data, offsets: array.array):
+        """
+        Initialize the chain.
+        
+        Args:
+            data: Memory-mapped log contents
+            offsets: Log offset of each block, by height
+        """
+        self._data = data
+        self._offsets = offsets
+        self._appended: List[Block] = []
+        self._last: Tuple[int, Optional[Block]] = (-1, None)  # Last decoded block, usually the tip
+    
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._appended)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1 and stop <= len(self._offsets):
+                return MappedChain(self._data, self._offsets[start:stop])
+            return [self[i] for i in range(start, stop, step)]
+        
+        if index < 0:
+            index += len(self)
+        mapped = len(self._offsets)
+        if index >= mapped:
+            return self._appended[index - mapped]
+        if index < 0:
+            raise IndexError("chain index out of range")
+        
+        cached_index, block = self._last
+        if cached_index != index:
+            block, _ = _decode_record(self._data, self._offsets[index])
+            self._last = (index, block)
+        return block
+    
+    def append(self, block: Block) -> None:
+        """Append a block in memory."""
+        self._appended.append(block)
+    
+    def packed_record(self, index: int) -> bytes:
+        """
+        Get a block's msgpack record without decoding the block.
+        
+        Logged blocks are returned as stored, which is the to_dict() form for
+        blocks logged before the binary layout.
+        """
+        if index < 0:
+            index += len(self)
+        mapped = len(self._offsets)
+        if index >= mapped:
+            return self._appended[index - mapped].to_packed_record()
+        if index < 0:
+            raise IndexError("chain index out of range")
+        
+        offset = self._offsets[index]
+        (length,) = RECORD_HEADER.unpack_from(self._data, offset)
+        start = offset + RECORD_HEADER.size
+        return self._data[start:start + length]
+
+
+class BlockchainStore:
+    """
+    Stores a blockchain in a data directory.
+    
+    Each store tracks which blocks it has logged and serializes its own saves,
+    so everything saving one blockchain must share a single store.
+    """
+    
+    def __init__(self, data_dir: str):
+        """
+        Initialize a store.
+        
+        Args:
+            data_dir: Directory holding the blockchain files
+        """
+        self.data_dir = data_dir
+        self.blocks_path = os.path.join(data_dir, BLOCKS_FILENAME)
+        self.index_path = os.path.join(data_dir, INDEX_FILENAME)
+        self.state_path = os.path.join(data_dir, STATE_FILENAME)
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_FILENAME)
+        self.legacy_path = os.path.join(data_dir, LEGACY_FILENAME)
+        self._lock = threading.Lock()
+        
+        # Height and tip hash of the blocks this store knows are in the log.
+        # None means the log contents are unknown and the next save rewrites it.
+        self._height: Optional[int] = None
+        self._tip: Optional[bytes] = None
+        self._snapshot_height = 0
+    
+    def load(self) -> Optional[Blockchain]:
+        """
+        Load the stored blockchain.
+        
+        Returns:
+            The blockchain, or None if nothing has been stored yet
+        """
+        if os.path.exists(self.blocks_path):
+            return self._load_log()
+        
+        if os.path.exists(self.legacy_path):
+            with open(self.legacy_path, 'rb') as f:
+                blockchain = Blockchain.from_dict(orjson.loads(f.read()))
+            # Migrate to the log format
+            self.save(blockchain)
+            return blockchain
+        
+        return None
+    
+    def save(self, blockchain: Blockchain, snapshot: bool = False) -> None:
+        """
+        Save the blockchain, appending only blocks not yet in the log.
+        
+        A state snapshot is also written every SNAPSHOT_INTERVAL blocks.
+        
+        Args:
+            blockchain: Blockchain to save
+            snapshot: Write a state snapshot regardless of the interval,
+                e.g. on shutdown
+        """
+        with self._lock:
+            os.makedirs(self.data_dir, exist_ok=True)
+            
+            # Capture the chain height with its state, so blocks appended by
+            # other threads while this save writes are left for the next one
+            with blockchain._chain_lock:
+                chain = blockchain.chain
+                height = len(chain)
+                tip = chain[-1].hash
+                state = self._chain_state(blockchain)
+                chain_snapshot = None
+                if snapshot or height - self._snapshot_height >= SNAPSHOT_INTERVAL:
+                    chain_snapshot = blockchain.snapshot()
+            
+            if (self._height is not None and self._height <= height
+                    and (self._height == 0 or chain[self._height - 1].hash == self._tip)):
+                self._append_blocks(chain[self._height:height])
+            else:
+                self._rewrite_blocks(chain[:height])
+            
+            self._height = height
+            self._tip = tip
+            replace_file(self.state_path, orjson.dumps(state))
+            
+            if chain_snapshot is not None:
+                self._write_snapshot(chain_snapshot)
+    
+    def _load_log(self) -> Optional[Blockchain]:
+        """Map the block log, replay it and restore the saved state."""
+        with self._lock:
+            blocks, complete = self._map_blocks()
+            if not blocks:
+                return None
+            
+            blockchain = Blockchain.from_blocks(blocks, self._read_snapshot(blocks))
+            
+            # A torn or inconsistent log is rewritten on the next save
+            if complete and len(blockchain.chain) == len(blocks):
+                self._height = len(blockchain.chain)
+                self._tip = blockchain.get_latest_block().hash
+            else:
+                print(f"Block log {self.blocks_path} is incomplete, it will be rewritten")
+            
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'rb') as f:
+                    state = orjson.loads(f.read())
+                if (state.get('tip') == blockchain.get_latest_block().hash.hex()
+                        and 'difficulty_bits' in state):
+                    blockchain.difficulty = state['difficulty_bits']
+                blockchain.pending_transactions = [Transaction.from_dict(tx_dict)
+                                                   for tx_dict in state.get('pending_transactions', [])]
+            
+            return blockchain
+    
+    def _read_snapshot(self, blocks: MappedChain) -> Optional[dict]:
+        """
+        Read the state snapshot if it matches the logged blocks.
+        
+        Returns:
+            The snapshot, or None if it is missing or does not match
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = msgpack.unpackb(f.read(), raw=False)
+            height = snapshot['height']
+            if 0 < height <= len(blocks) and blocks[height - 1].hash == snapshot['tip']:
+                self._snapshot_height = height
+                return snapshot
+        except (ValueError, TypeError, KeyError):
+            pass
+        
+        print(f"Snapshot {self.snapshot_path} does not match the block log, replaying all blocks")
+        return None
+    
+    def _write_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """Write a snapshot of the replayed chain state, from Blockchain.snapshot()."""
+        replace_file(self.snapshot_path, msgpack.packb(snapshot, use_bin_type=True))
+        self._snapshot_height = snapshot['height']
+    
+    def _map_blocks(self) -> Tuple[Optional[MappedChain], bool]:
+        """
+        Memory-map the block log and locate its blocks.
+        
+        Offsets come from the index file where it is consistent with the log;
+        records past the indexed ones are scanned, and the index is rewritten
+        if that found anything.
+        
+        Returns:
+            (blocks, complete) where complete is False if the log ends in a
+            partially written record or a record out of sequence
+        """
+        with open(self.blocks_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None, True
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        offsets = self._read_index(data)
+        indexed = len(offsets)
+        offset = _decode_record(data, offsets[-1])[1] if offsets else 0
+        complete = True
+        
+        while offset < size:
+            if offset + RECORD_HEADER.size > size:
+                complete = False
+                break
+            (length,) = RECORD_HEADER.unpack_from(data, offset)
+            if offset + RECORD_HEADER.size + length > size:
+                complete = False
+                break
+            
+            # A record out of sequence leaves the log to be rewritten like a torn one
+            block, end = _decode_record(data, offset)
+            if block.index != len(offsets):
+                complete = False
+                break
+            offsets.append(offset)
+            offset = end
+        
+        if len(offsets) != indexed:
+            replace_file(self.index_path, offsets.tobytes())
+        
+        return MappedChain(data, offsets), complete
+    
+    def _read_index(self, data) -> array.array:
+        """
+        Read the block offset index, checked against the mapped log.
+        
+        Returns:
+            The offsets, or an empty array if the index is missing or stale
+        """
+        offsets = array.array(OFFSET_TYPECODE)
+        if not os.path.exists(self.index_path):
+            return offsets
+        
+        with open(self.index_path, 'rb') as f:
+            raw = f.read()
+        if len(raw) % offsets.itemsize:
+            return offsets
+        offsets.frombytes(raw)
+        
+        # The last indexed record must be intact and hold the block at that height
+        try:
+            if offsets and (offsets[0] != 0
+                            or _decode_record(data, offsets[-1])[0].index != len(offsets) - 1):
+                return array.array(OFFSET_TYPECODE)
+        except (ValueError, TypeError, KeyError, struct.error):
+            return array.array(OFFSET_TYPECODE)
+        
+        return offsets
+    
+    @staticmethod
+    def _encode_block(block: Block) -> bytes:
+        """Encode a block as a length-prefixed log record."""
+        payload = block.to_packed_record()
+        return RECORD_HEADER.pack(len(payload)) + payload
+    
+    @staticmethod
+    def _encode_blocks(blocks, start: int) -> Tuple[bytes, array.array]:
+        """
+        Encode blocks as consecutive log records.
+        
+        Args:
+            blocks: Blocks to encode
+            start: Log offset of the first record
+        
+        Returns:
+            (records, offsets) with the log offset of each record
+        """
+        records = []
+        offsets = array.array(OFFSET_TYPECODE)
+        for block in blocks:
+            offsets.append(start)
+            record = BlockchainStore._encode_block(block)
+            records.append(record)
+            start += len(record)
+        return b''.join(records), offsets
+    
+    def _append_blocks(self, blocks: List[Block]) -> None:
+        """
+        Append blocks to the log in a single write, then index them.
+        
+        The log is synced to disk before the index is written. The index
+        is not synced, since loading rebuilds any entries it is missing.
+        """
+        if not blocks:
+            return
+        with open(self.blocks_path, 'ab') as f:
+            records, offsets = self._encode_blocks(blocks, f.tell())
+            f.write(records)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, 'ab') as f:
+            f.write(offsets.tobytes())
+    
+    def _rewrite_blocks(self, blocks: List[Block]) -> None:
+        """Replace the log and its index with the given blocks."""
+        records, offsets = self._encode_blocks(blocks, 0)
+        replace_file(self.blocks_path, records)
+        replace_file(self.index_path, offsets.tobytes())
+    
+    @staticmethod
+    def _chain_state(blockchain: Blockchain) -> Dict[str, Any]:
+        """Capture the non-block chain state."""
+        return {
+            'height': len(blockchain.chain),
+            'tip': blockchain.get_latest_block().hash.hex(),
+            'difficulty_bits': blockchain.difficulty,
+            'pending_transactions': [tx.to_dict() for tx in blockchain.pending_transactions]
+        }
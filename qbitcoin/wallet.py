@@ -4,9 +4,10 @@ Provides key generation, transaction signing, and balance checking.
 """
 
 import os
-import json
 from typing import Dict, Any, List, Optional
+import orjson
 from .crypto import QBitcoinCrypto
+from .storage import replace_file
 
 class Wallet:
     """QBitcoin wallet implementation using SPHINCS+ signatures."""
@@ -20,14 +21,15 @@ class Wallet:
         """
         self.keyfile_path = keyfile_path
         self.keys = self._load_or_generate_keys()
+        self.public_key: str = self.keys['public_key']  # The wallet's address
     
     def _load_or_generate_keys(self) -> Dict[str, str]:
         """Load keys from file or generate new ones."""
         if self.keyfile_path and os.path.exists(self.keyfile_path):
             # Load keys from file
             try:
-                with open(self.keyfile_path, 'r') as f:
-                    keys = json.load(f)
+                with open(self.keyfile_path, 'rb') as f:
+                    keys = orjson.loads(f.read())
                 print(f"Loaded wallet from {self.keyfile_path}")
                 return keys
             except Exception as e:
@@ -47,15 +49,13 @@ class Wallet:
         """Save keys to file."""
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(os.path.abspath(self.keyfile_path)), exist_ok=True)
-        
-        with open(self.keyfile_path, 'w') as f:
-            json.dump(keys, f)
+        replace_file(self.keyfile_path, orjson.dumps(keys))
         
         print(f"Saved wallet to {self.keyfile_path}")
     
     def get_public_key(self) -> str:
         """Get the wallet's public key (address)."""
-        return self.keys['public_key']
+        return self.public_key
     
     def sign_transaction(self, transaction) -> None:
         """
@@ -65,7 +65,7 @@ class Wallet:
             transaction: Transaction to sign
         """
         # Ensure the sender is this wallet's address
-        if transaction.sender != self.get_public_key():
+        if transaction.sender != self.public_key:
             raise ValueError("Transaction sender doesn't match wallet public key")
         
         # Sign the transaction
@@ -87,13 +87,13 @@ class Wallet:
         from .blockchain import Transaction
         
         # Check balance
-        balance = blockchain.get_balance(self.get_public_key())
+        balance = blockchain.get_balance(self.public_key)
         if balance < amount + fee:
             raise ValueError(f"Insufficient balance: {balance} < {amount + fee}")
         
         # Create transaction
         transaction = Transaction(
-            sender=self.get_public_key(),
+            sender=self.public_key,
             recipient=recipient,
             amount=amount,
             fee=fee
@@ -114,7 +114,7 @@ class Wallet:
         Returns:
             Current balance
         """
-        return blockchain.get_balance(self.get_public_key())
+        return blockchain.get_balance(self.public_key)
 
 
 class WalletManager:
@@ -222,10 +222,9 @@ class WalletManager:
         Returns:
             List of wallet names
         """
-        wallets = []
-        
-        for filename in os.listdir(self.wallet_dir):
-            if filename.endswith('.json'):
-                wallets.append(filename[:-5])  # Remove .json extension
-        
-        return wallets 
\ No newline at end of file
+        # scandir reports each entry's type along with its name, so telling
+        # wallet files from directories takes no extra stat calls
+        with os.scandir(self.wallet_dir) as entries:
+            return [entry.name[:-5]  # Remove .json extension
+                    for entry in entries
+                    if entry.name.endswith('.json') and entry.is_file()] 
\ No newline at end of file
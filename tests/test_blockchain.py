@@ -0,0 +1,91 @@
+"""Tests for blocks, transactions and chain validation."""
+
+import unittest
+from qbitcoin.blockchain import Blockchain, Block, Transaction
+
+
+def mine_chain(blocks: int) -> Blockchain:
+    """Mine a short chain at the lowest difficulty."""
+    blockchain = Blockchain()
+    blockchain.difficulty = 1
+    for _ in range(blocks):
+        blockchain.mine_pending_transactions("miner")
+    return blockchain
+
+
+def genesis_only(source: Blockchain) -> Blockchain:
+    """Get a chain holding only the source chain's genesis block, at the lowest difficulty."""
+    blockchain = Blockchain()
+    blockchain.chain = source.chain[:1]
+    blockchain._rebuild_balances()
+    blockchain.difficulty = 1
+    return blockchain
+
+
+class TamperedTransactionTest(unittest.TestCase):
+    """A block must commit to its transactions' contents, not just their txids."""
+    
+    def setUp(self):
+        self.chain_dict = mine_chain(2).to_dict()
+    
+    def test_untampered_chain_is_valid(self):
+        self.assertTrue(Blockchain.from_dict(self.chain_dict).is_chain_valid())
+    
+    def test_tampered_coinbase_is_rejected(self):
+        self.chain_dict['chain'][1]['transactions'][0]['amount'] = 1e6
+        blockchain = Blockchain.from_dict(self.chain_dict)
+        self.assertFalse(blockchain.is_chain_valid())
+    
+    def test_tampered_block_is_not_added(self):
+        source = Blockchain.from_dict(self.chain_dict)
+        block = source.chain[1]
+        coinbase = block.transactions[0]
+        claimed_txid = coinbase.txid
+        coinbase.amount = 1e6
+        coinbase.txid = claimed_txid
+        
+        blockchain = genesis_only(source)
+        self.assertFalse(blockchain.add_block(block))
+        self.assertEqual(len(blockchain.chain), 1)
+
+
+class ReceivedBlockTest(unittest.TestCase):
+    """Blocks from elsewhere must carry their header hash and enough proof of work."""
+    
+    def setUp(self):
+        self.source = Blockchain.from_dict(mine_chain(1).to_dict())
+        self.blockchain = genesis_only(self.source)
+        self.block = self.source.chain[1]
+    
+    def test_valid_block_is_added(self):
+        self.assertTrue(self.blockchain.add_block(self.block))
+        self.assertEqual(len(self.blockchain.chain), 2)
+    
+    def test_wrong_hash_is_rejected(self):
+        self.block.hash = bytes(32)
+        self.assertFalse(self.blockchain.add_block(self.block))
+    
+    def test_insufficient_proof_of_work_is_rejected(self):
+        self.blockchain.difficulty = 32
+        self.assertFalse(self.blockchain.add_block(self.block))
+
+
+
+class ZeroTimestampTest(unittest.TestCase):
+    """An explicit zero timestamp is kept, not replaced by the current time."""
+    
+    def test_transaction_record_round_trip(self):
+        tx = Transaction("sender", "recipient", 1.0, 0.0, timestamp=0.0)
+        decoded = Transaction.from_record(tx.to_record())
+        self.assertEqual(decoded.timestamp, 0.0)
+        self.assertTrue(decoded.has_valid_txid())
+    
+    def test_block_record_round_trip(self):
+        block = Block(1, bytes(32), timestamp=0.0)
+        decoded = Block.from_record(block.to_record())
+        self.assertEqual(decoded.timestamp, 0.0)
+        self.assertEqual(decoded.hash, block.hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""Tests for encoding, splitting and receiving P2P messages."""
+
+import shutil
+import socket
+import tempfile
+import unittest
+from qbitcoin.blockchain import Blockchain
+from qbitcoin.node import (
+    FRAME_HEADER, MAX_MESSAGE_SIZE, Message, MessageBuffer, Node, NoReplyError, Peer,
+    block_from_message, encode_frame, encode_json, receive_reply, transaction_from_message,
+)
+
+from test_blockchain import mine_chain
+
+MESSAGE = {'type': Message.BLOCKS, 'blocks': [{'index': 1, 'hash': b'\x00' * 32}]}
+JSON_MESSAGE = {'type': Message.PEERS, 'peers': [["127.0.0.1", 9333]]}
+
+
+class MessageBufferTest(unittest.TestCase):
+    """Messages are taken off a buffer whole, or not at all."""
+    
+    def setUp(self):
+        self.buffer = MessageBuffer()
+    
+    def feed_bytewise(self, data: bytes):
+        for i in range(len(data) - 1):
+            self.assertEqual(self.buffer.feed(data[i:i + 1]), [])
+        return self.buffer.feed(data[-1:])
+    
+    def test_frame_round_trip(self):
+        frame = encode_frame(MESSAGE)
+        self.assertEqual(self.buffer.feed(frame + frame[:5]), [MESSAGE])
+        self.assertEqual(bytes(self.buffer.data), frame[:5])
+    
+    def test_frame_with_packed_fields(self):
+        frame = encode_frame({'type': Message.HEIGHT}, {'height': b'\x05'})
+        self.assertEqual(self.buffer.feed(frame), [{'type': Message.HEIGHT, 'height': 5}])
+    
+    def test_json_round_trip(self):
+        data = b' ' + encode_json(JSON_MESSAGE) + b'\n' + encode_frame(MESSAGE)
+        self.assertEqual(self.buffer.feed(data), [JSON_MESSAGE, MESSAGE])
+        self.assertEqual(self.buffer.data, b'')
+    
+    def test_truncated_frame_waits(self):
+        self.assertEqual(self.feed_bytewise(encode_frame(MESSAGE)), [MESSAGE])
+    
+    def test_truncated_json_waits(self):
+        message = {'type': Message.NEW_TRANSACTION, 'note': 'a "}" {\\'}
+        data = encode_json(message)
+        self.assertEqual(self.feed_bytewise(data), [message])
+        self.assertEqual(self.buffer.data, b'')
+    
+    def test_oversized_frame_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.buffer.feed(FRAME_HEADER.pack(MAX_MESSAGE_SIZE + 1))
+    
+    def test_oversized_json_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.buffer.feed(b'{"type": "' + bytes(MAX_MESSAGE_SIZE))
+    
+    def test_malformed_json_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.buffer.feed(b'{"type": \xff}')
+
+
+class BroadcastMessageTest(unittest.TestCase):
+    """Blocks and transactions decode the same from frames and from bare JSON."""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.block = mine_chain(1).chain[1]
+    
+    def framed(self, message, packed):
+        return MessageBuffer().feed(encode_frame(message, packed))[0]
+    
+    def test_framed_block(self):
+        message = self.framed({'type': Message.NEW_BLOCK}, {'block': self.block.to_packed_record()})
+        self.assertEqual(block_from_message(message['block']).to_dict(), self.block.to_dict())
+    
+    def test_bare_json_block(self):
+        block_dict = self.block.to_dict()
+        self.assertEqual(block_from_message(block_dict).to_dict(), block_dict)
+    
+    def test_framed_transaction(self):
+        tx = self.block.transactions[0]
+        message = self.framed({'type': Message.NEW_TRANSACTION}, {'transaction': tx.to_packed_record()})
+        self.assertEqual(transaction_from_message(message['transaction']).to_dict(), tx.to_dict())
+    
+    def test_bare_json_transaction(self):
+        tx_dict = self.block.transactions[0].to_dict()
+        self.assertEqual(transaction_from_message(tx_dict).to_dict(), tx_dict)
+
+
+class ReceiveReplyTest(unittest.TestCase):
+    """Replies are received whole, within the size limit."""
+    
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+        self.addCleanup(self.sock.close)
+        self.addCleanup(self.peer.close)
+    
+    def reply(self, data: bytes):
+        self.peer.sendall(data)
+        self.peer.shutdown(socket.SHUT_WR)
+        return receive_reply(self.sock)
+    
+    def test_frame(self):
+        self.assertEqual(self.reply(encode_frame(MESSAGE)), MESSAGE)
+    
+    def test_bare_json(self):
+        self.assertEqual(self.reply(encode_json(JSON_MESSAGE)), JSON_MESSAGE)
+    
+    def test_oversized_frame_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.reply(FRAME_HEADER.pack(MAX_MESSAGE_SIZE + 1))
+    
+    def test_truncated_header(self):
+        with self.assertRaises(ConnectionError):
+            self.reply(b'\x00\x00')
+    
+    def test_truncated_frame(self):
+        with self.assertRaises(ConnectionError):
+            self.reply(encode_frame(MESSAGE)[:-1])
+    
+    def test_closed_without_reply(self):
+        with self.assertRaises(NoReplyError):
+            self.reply(b'')
+
+
+class ScriptedPool:
+    """Connection pool answering each request type with a set reply or error."""
+    
+    def __init__(self, replies):
+        self.replies = replies
+        self.requested = []
+    
+    def request(self, peer, message, timeout=5):
+        self.requested.append(message['type'])
+        reply = self.replies[message['type']]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class PeerHeightTest(unittest.TestCase):
+    """Only a peer rejecting get_height is asked for its latest block from then on."""
+    
+    LATEST_BLOCK = {'type': Message.BLOCKS, 'blocks': [{'index': 7}]}
+    
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        self.peer = Peer("127.0.0.1", 1)
+        self.node = Node(port=0, data_dir=data_dir, seed_peers=[self.peer.to_dict()],
+                         blockchain=Blockchain())
+        self.addCleanup(self.node.socket.close)
+        self.addCleanup(self.node.pool.shutdown)
+    
+    def probe(self, height_reply):
+        pool = self.node.conn_pool = ScriptedPool({
+            Message.GET_HEIGHT: height_reply,
+            Message.GET_BLOCKS: self.LATEST_BLOCK
+        })
+        return self.node._get_peer_blockchain_height(self.peer), pool.requested
+    
+    def test_height(self):
+        reply = {'type': Message.HEIGHT, 'height': 5}
+        self.assertEqual(self.probe(reply), (5, [Message.GET_HEIGHT]))
+        self.assertNotIn(self.peer, self.node._height_unsupported)
+    
+    def test_rejected(self):
+        self.assertEqual(self.probe(NoReplyError()), (7, [Message.GET_HEIGHT, Message.GET_BLOCKS]))
+        self.assertEqual(self.probe(NoReplyError()), (7, [Message.GET_BLOCKS]))
+    
+    def test_other_reply_type(self):
+        reply = {'type': Message.PONG}
+        self.assertEqual(self.probe(reply), (7, [Message.GET_HEIGHT, Message.GET_BLOCKS]))
+        self.assertIn(self.peer, self.node._height_unsupported)
+    
+    def test_transient_failures_are_not_remembered(self):
+        for error in (socket.timeout(), ConnectionResetError()):
+            self.assertEqual(self.probe(error), (0, [Message.GET_HEIGHT]))
+        self.assertNotIn(self.peer, self.node._height_unsupported)
+    
+    def test_removed_peer_is_forgotten(self):
+        self.probe(NoReplyError())
+        self.node._remove_peers({self.peer})
+        self.assertNotIn(self.peer, self.node._height_unsupported)
+        self.node._add_peer(self.peer)
+        self.assertEqual(self.probe({'type': Message.HEIGHT, 'height': 5}), (5, [Message.GET_HEIGHT]))
+
+
+if __name__ == '__main__':
+    unittest.main()
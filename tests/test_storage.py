@@ -0,0 +1,117 @@
+"""Tests for saving and loading the blockchain."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from qbitcoin.storage import BlockchainStore, MappedChain
+
+from test_blockchain import mine_chain
+
+
+class BlockchainStoreTest(unittest.TestCase):
+    """A loaded chain must match the chain that was saved."""
+    
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+    
+    def assertSameChain(self, loaded, saved):
+        self.assertIsNotNone(loaded)
+        self.assertEqual(loaded.to_dict(), saved.to_dict())
+        self.assertEqual(loaded.get_balance("miner"), saved.get_balance("miner"))
+        self.assertTrue(loaded.is_chain_valid())
+    
+    def test_empty_store_loads_nothing(self):
+        self.assertIsNone(BlockchainStore(self.data_dir).load())
+    
+    def test_round_trip(self):
+        blockchain = mine_chain(3)
+        BlockchainStore(self.data_dir).save(blockchain)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+    
+    def test_round_trip_with_snapshot(self):
+        blockchain = mine_chain(3)
+        BlockchainStore(self.data_dir).save(blockchain, snapshot=True)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+    
+    def test_blocks_after_snapshot_are_replayed(self):
+        blockchain = mine_chain(2)
+        store = BlockchainStore(self.data_dir)
+        store.save(blockchain, snapshot=True)
+        blockchain.mine_pending_transactions("miner")
+        store.save(blockchain)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+    
+    def test_appended_blocks_are_loaded(self):
+        blockchain = mine_chain(2)
+        store = BlockchainStore(self.data_dir)
+        store.save(blockchain)
+        blockchain.mine_pending_transactions("miner")
+        blockchain.mine_pending_transactions("miner")
+        store.save(blockchain)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+    
+    def test_block_appended_during_save_is_saved_next(self):
+        blockchain = mine_chain(2)
+        store = BlockchainStore(self.data_dir)
+        store.save(blockchain)
+        append_blocks = store._append_blocks
+        
+        def append_while_mining(blocks):
+            blockchain.mine_pending_transactions("miner")
+            append_blocks(blocks)
+        
+        store._append_blocks = append_while_mining
+        blockchain.mine_pending_transactions("miner")
+        store.save(blockchain)
+        store._append_blocks = append_blocks
+        store.save(blockchain)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+    
+    def test_block_out_of_sequence_is_dropped(self):
+        blockchain = mine_chain(2)
+        store = BlockchainStore(self.data_dir)
+        store.save(blockchain)
+        store._append_blocks(blockchain.chain[-1:])
+        os.remove(store.index_path)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+    
+    def test_replaced_chain_is_rewritten(self):
+        store = BlockchainStore(self.data_dir)
+        store.save(mine_chain(3))
+        replacement = mine_chain(2)
+        store.save(replacement)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), replacement)
+
+    
+    def test_loaded_blocks_are_mapped(self):
+        blockchain = mine_chain(3)
+        BlockchainStore(self.data_dir).save(blockchain)
+        loaded = BlockchainStore(self.data_dir).load()
+        self.assertIsInstance(loaded.chain, MappedChain)
+        self.assertEqual(bytes(loaded.chain.packed_record(2)), blockchain.chain[2].to_packed_record())
+    
+    def test_missing_index_is_rebuilt(self):
+        blockchain = mine_chain(3)
+        store = BlockchainStore(self.data_dir)
+        store.save(blockchain)
+        with open(store.index_path, 'rb') as f:
+            index = f.read()
+        os.remove(store.index_path)
+        self.assertSameChain(BlockchainStore(self.data_dir).load(), blockchain)
+        with open(store.index_path, 'rb') as f:
+            self.assertEqual(f.read(), index)
+    
+    def test_torn_record_is_dropped(self):
+        blockchain = mine_chain(3)
+        store = BlockchainStore(self.data_dir)
+        store.save(blockchain)
+        with open(store.blocks_path, 'r+b') as f:
+            f.truncate(os.path.getsize(store.blocks_path) - 1)
+        loaded = BlockchainStore(self.data_dir).load()
+        self.assertEqual(len(loaded.chain), 3)
+        self.assertEqual(loaded.get_latest_block().hash, blockchain.chain[2].hash)
+
+if __name__ == '__main__':
+    unittest.main()